@@ -2,27 +2,27 @@
 import argparse
 import Base
 
-# TODO: Make routes for (1) xml files
-
 def main(args):
 
     group = args.group
     lang_code = args.lang_code
     text = args.text
     overwrite = args.overwrite
+    skip_duplicates = args.skip_duplicates
 
-    cleaner = Base.CaptionCleaner(group, lang_code, text, overwrite)
+    cleaner = Base.CaptionCleaner(group, lang_code, text, overwrite, skip_duplicates)
     cleaner.process_captions()
 
 if __name__ == '__main__':
 
-    parser = argparse.ArgumentParser(description='Convert scraped YouTube SRT captions to cleaned transcript text format.')
+    parser = argparse.ArgumentParser(description='Convert scraped YouTube SRT or XML captions to cleaned transcript text format.')
 
     parser.set_defaults(func=None)
     parser.add_argument('-g', '--group', default="ungrouped", type=str, help='name to group files under (create and /or assume files are located in a subfolder: e.g., cleaned_subtitles/$group)')
     parser.add_argument('-l','--lang_code',  default=None, type=str, help='open captions with a specific a language code (e.g., "en"); if unspecified, goes through all available language code in subtitle directory')
     parser.add_argument('-t', '--text', action='store_true', default=False, help='additionally output text-only file')
     parser.add_argument('-o', '--overwrite', action='store_true', default=False, help='overwrite files rather than appending')
+    parser.add_argument('-d', '--skip_duplicates', action='store_true', default=False, help='skip videos flagged as near-duplicates in the group log by 8-find-duplicates.py')
 
     args = parser.parse_args()
 
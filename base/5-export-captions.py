@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+import argparse
+import Base
+
+
+def main(args):
+
+    group = args.group
+    lang_code = args.lang_code
+    overwrite = args.overwrite
+
+    exporter = Base.CaptionExporter(group, lang_code, overwrite)
+    exporter.process_captions()
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Pack cleaned captions into one columnar (Parquet) corpus per group, partitioned by caption type, language, and channel.')
+
+    parser.set_defaults(func=None)
+    parser.add_argument('-g', '--group', default="ungrouped", type=str, help='name to group files under (assume files are located in a subfolder: e.g., cleaned_subtitles/$group)')
+    parser.add_argument('-l','--lang_code',  default=None, type=str, help='export captions with a specific a language code (e.g., "en"); if unspecified, goes through all available language codes in subtitle directory')
+    parser.add_argument('-o', '--overwrite', action='store_true', default=False, help='re-export all channels rather than only channels with new or changed captions')
+
+    args = parser.parse_args()
+
+    main(args)
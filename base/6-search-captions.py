@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import argparse
+import Base
+
+
+def main(args):
+
+    group = args.group
+    lang_code = args.lang_code
+    overwrite = args.overwrite
+
+    indexer = Base.CaptionIndexer(group, lang_code, overwrite)
+
+    if args.index or overwrite:
+        indexer.update_index()
+
+    if args.query:
+        matches = indexer.search(args.query, args.channel, args.caption_type, args.limit)
+        for (caption_type, lang, channel, video, cue, start_ms, end_ms, text) in matches:
+            print("{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}".format(caption_type, lang, video, cue, start_ms, end_ms, text))
+        print("Found {0} matching cues".format(len(matches)))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Index cleaned captions and search them for a word or phrase.')
+
+    parser.set_defaults(func=None)
+    parser.add_argument('query', nargs='?', default=None, type=str, help='word or phrase to search for; matching cues are printed with start and end times in milliseconds')
+    parser.add_argument('-g', '--group', default="ungrouped", type=str, help='name to group files under (assume files are located in a subfolder: e.g., cleaned_subtitles/$group)')
+    parser.add_argument('-l','--lang_code',  default=None, type=str, help='index and search captions with a specific a language code (e.g., "en"); if unspecified, uses all available language codes')
+    parser.add_argument('-ch', '--channel', default=None, type=str, help='only return matches from a specific channel (e.g., $channel_name_$channel_id)')
+    parser.add_argument('-ct', '--caption_type', default=None, choices=["auto", "manual", "corrected"], help='only return matches from a specific caption type')
+    parser.add_argument('-lim', '--limit', type=int, metavar='N', default=-1, help='return at most N matching cues')
+    parser.add_argument('-i', '--index', action='store_true', default=False, help='add new or changed cleaned captions to the index before searching')
+    parser.add_argument('-o', '--overwrite', action='store_true', default=False, help='rebuild the index from scratch')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+import argparse
+import Base
+
+
+def main(args):
+
+    group = args.group
+    lang_code = args.lang_code
+    max_n = args.max_n
+    workers = args.workers
+    memory = args.memory
+
+    stats = Base.CaptionStats(group, lang_code, max_n, workers, memory)
+    stats.process_captions()
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Count word and n-gram frequencies over cleaned caption texts, per channel and per group.')
+
+    parser.set_defaults(func=None)
+    parser.add_argument('-g', '--group', default="ungrouped", type=str, help='name to group files under (assume files are located in a subfolder: e.g., cleaned_subtitles/$group)')
+    parser.add_argument('-l','--lang_code',  default=None, type=str, help='count captions with a specific a language code (e.g., "en"); if unspecified, goes through all available language codes')
+    parser.add_argument('-n', '--max_n', default=3, type=int, metavar='N', help='count all n-grams up to length N (default: 3)')
+    parser.add_argument('-w', '--workers', default=1, type=int, help='number of worker processes')
+    parser.add_argument('-m', '--memory', default=512, type=int, metavar='MB', help='approximate memory budget for counting; counts are spilled to disk beyond it (default: 512)')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+import argparse
+import Base
+
+
+def main(args):
+
+    group = args.group
+    lang_code = args.lang_code
+    cleaned = args.cleaned
+    threshold = args.threshold
+    shingle_size = args.shingle_size
+    screen = args.screen
+
+    detector = Base.DuplicateDetector(group, lang_code, cleaned, threshold, shingle_size, screen=screen)
+    detector.process_captions()
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Find near-duplicate videos (re-uploads, compilations) by caption similarity and flag them in the group log.')
+
+    parser.set_defaults(func=None)
+    parser.add_argument('-g', '--group', default="ungrouped", type=str, help='name to group files under (assume files are located in a subfolder: e.g., raw_subtitles/$group)')
+    parser.add_argument('-l','--lang_code',  default=None, type=str, help='compare captions with a specific a language code (e.g., "en"); if unspecified, goes through all available language codes')
+    parser.add_argument('-c', '--cleaned', action='store_true', default=False, help='compare cleaned captions (cleaned_subtitles/$group) rather than raw captions')
+    parser.add_argument('-t', '--threshold', default=0.8, type=float, help='minimum estimated similarity (Jaccard, 0-1) of two caption tracks for them to count as duplicates (default: 0.8)')
+    parser.add_argument('-k', '--shingle_size', default=5, type=int, metavar='K', help='compare captions as sets of K-word sequences (default: 5)')
+    parser.add_argument('-s', '--screen', action='store_true', default=False, help='use unscreened videos and log (unscreened_videos/$group)')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -1,15 +1,16 @@
-import math, time, logging, shutil
+import math, time, logging, shutil, hashlib, inspect, json, sqlite3, heapq, tempfile, zlib
+import numpy as np
 import pandas as pd
 
-import xml.etree.ElementTree as ElementTree
-
 from pytube import YouTube, Channel, exceptions, helpers
-from os import path, makedirs, remove, rename, listdir
-from re import sub, findall
+from os import path, makedirs, remove, rename, listdir, replace, stat
+from re import sub, findall, fullmatch
 from glob import glob
-from csv import DictWriter
+from csv import DictWriter, DictReader
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
-from html import unescape
+import Captions
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -575,41 +576,15 @@ class VideoScraper:
         """
 
         segments = []
-        try:
-            root = ElementTree.fromstring(xml_captions)[1]
-        except IndexError as e:
-            root = ElementTree.fromstring(xml_captions)[0]
-
-        i=0
-        for child in list(root):
-            if child.tag == 'p':
-                caption = ''
-                if len(list(child))==0:
-                    caption = child.text
-                    if not caption.strip():
-                        continue
-                else:
-                    for s in list(child):
-                        if s.tag == 's':
-                            caption += ' ' + s.text
-                caption = unescape(caption.replace("\n", " ").replace("  ", " "),)
-                if not caption.strip():
-                    continue
-                try:
-                    duration = float(child.attrib["d"])/1000.0
-                except KeyError:
-                    duration = 0.0
-                start = float(child.attrib["t"])/1000.0
-                end = start + duration
-                sequence_number = i + 1  # convert from 0-indexed to 1.
-                line = "{seq}\n{start} --> {end}\n{text}\n".format(
-                    seq=sequence_number,
-                    start=self.float_to_srt_time_format(start),
-                    end=self.float_to_srt_time_format(end),
-                    text=caption,
-                )
-                segments.append(line)
-            i += 1
+        for i, (start_ms, end_ms, caption) in enumerate(Captions.iter_xml_cues(xml_captions)):
+            sequence_number = i + 1  # convert from 0-indexed to 1.
+            line = "{seq}\n{start} --> {end}\n{text}\n".format(
+                seq=sequence_number,
+                start=self.float_to_srt_time_format(start_ms / 1000.0),
+                end=self.float_to_srt_time_format(end_ms / 1000.0),
+                text=caption,
+            )
+            segments.append(line)
         return "\n".join(segments).strip()
 
 
@@ -979,15 +954,125 @@ class BatchVideoScraper:
             scraper.process_videos()
 
 
+class CleaningManifest:
+
+    def __init__(self, manifest_path, version, save_every=50):
+
+        self.manifest_path = manifest_path
+        self.version       = version
+        self.save_every    = save_every
+
+        self.entries       = {}
+        self.unsaved       = 0
+
+        if path.isfile(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r') as manifest_in:
+                    self.entries = json.load(manifest_in)
+            except json.decoder.JSONDecodeError:
+                logging.warning("Could not read cleaning manifest {0}; all captions will be re-cleaned".format(self.manifest_path))
+
+
+    def hash_file(self, fp):
+        """Compute the SHA-1 of a file's contents.
+
+        :return digest: Hex digest of the file
+        """
+
+        digest = hashlib.sha1()
+        with open(fp, 'rb') as file_in:
+            for block in iter(lambda: file_in.read(1 << 16), b''):
+                digest.update(block)
+
+        return digest.hexdigest()
+
+
+    def is_current(self, raw_path, out_paths):
+        """Check whether a raw caption file was already cleaned from its current contents by the current cleaner version.
+        The file is only re-hashed when its size or modification time changed since it was recorded.
+
+        :param raw_path: Path to the raw caption file
+        :param out_paths: Paths to the outputs that a clean run would produce
+
+        :return current: True if the recorded outputs are up to date
+        """
+
+        entry = self.entries.get(raw_path)
+        if entry is None or entry["version"] != self.version:
+            return False
+
+        # Every requested output must have been produced (e.g., texts added with -t later)
+        if not set(out_paths).issubset(entry["outputs"]) or not all(path.isfile(fp) for fp in out_paths):
+            return False
+
+        raw_stat = stat(raw_path)
+        if raw_stat.st_size == entry["size"] and raw_stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+
+        if raw_stat.st_size != entry["size"] or self.hash_file(raw_path) != entry["sha1"]:
+            return False
+
+        # Contents unchanged (e.g., file was touched); remember the new timestamp
+        entry["mtime_ns"] = raw_stat.st_mtime_ns
+        self.mark_dirty()
+
+        return True
+
+
+    def update(self, raw_path, out_paths):
+        """Record the outputs cleaned from a raw caption file.
+        """
+
+        raw_stat = stat(raw_path)
+        self.entries[raw_path] = {"sha1": self.hash_file(raw_path),
+                                  "size": raw_stat.st_size,
+                                  "mtime_ns": raw_stat.st_mtime_ns,
+                                  "version": self.version,
+                                  "outputs": sorted(out_paths)}
+        self.mark_dirty()
+
+
+    def mark_dirty(self):
+
+        self.unsaved += 1
+        if self.unsaved >= self.save_every:
+            self.save()
+
+
+    def save(self):
+        """Write the manifest to disk, replacing the previous version atomically.
+        """
+
+        if not self.unsaved:
+            return
+
+        manifest_dir = path.dirname(self.manifest_path)
+        if not path.exists(manifest_dir):
+            makedirs(manifest_dir)
+
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as manifest_out:
+            json.dump(self.entries, manifest_out, indent=1, sort_keys=True)
+        replace(tmp_path, self.manifest_path)
+
+        self.unsaved = 0
+
+
 class CaptionCleaner:
 
-    def __init__(self, group="_ungrouped", lang_code=None, text=False, overwrite=False):
+    # Bump when cleaning output changes for reasons the source fingerprint can't see (e.g., a library update)
+    VERSION = 1
+
+    def __init__(self, group="_ungrouped", lang_code=None, text=False, overwrite=False, skip_duplicates=False):
 
         self.group     = group
         self.lang_code = lang_code
         self.text      = text
         self.overwrite = overwrite
 
+        # Videos flagged by DuplicateDetector in the group log
+        self.duplicates = Captions.read_duplicates(self.group) if skip_duplicates else set()
+
         self.raw_sub_base = path.join('corpus','raw_subtitles',  self.group)
         self.clean_sub_base = path.join('corpus','cleaned_subtitles', self.group)
 
@@ -997,6 +1082,26 @@ class CaptionCleaner:
             except FileNotFoundError as e:
                 pass
 
+        self.manifest = CleaningManifest(path.join(self.clean_sub_base, 'manifest.json'), self.get_version())
+
+
+    def get_version(self):
+        """Fingerprint the cleaning rules so that outputs are invalidated whenever they change.
+
+        :return version: The cleaner version and a hash of the source of the cleaning functions
+        """
+
+        rules = [Captions.iter_cues, Captions.iter_xml_cues, Captions.iter_xml_words, Captions.timestamp_to_ms, self.get_timestamped_lines, self.clean_text, self.write_to_output, self.write_word_timings]
+
+        digest = hashlib.sha1()
+        for rule in rules:
+            try:
+                digest.update(inspect.getsource(rule).encode('utf-8'))
+            except (OSError, TypeError) as e:
+                digest.update(rule.__qualname__.encode('utf-8'))
+
+        return "{0}-{1}".format(self.VERSION, digest.hexdigest()[:12])
+
 
     def process_captions(self):
 
@@ -1017,6 +1122,7 @@ class CaptionCleaner:
                 in_dir = path.join(raw_sub_dir, langcode)
                 cleans_dir = path.join(clean_sub_dir, langcode, "cleans")
                 text_dir = path.join(clean_sub_dir, langcode, "texts")
+                words_dir = path.join(clean_sub_dir, langcode, "words")
 
                 if path.isdir(in_dir):
                     dir_list = [dir_element for dir_element in listdir(in_dir)]
@@ -1028,31 +1134,22 @@ class CaptionCleaner:
                             channel_in_dir = path.join(in_dir, dir_element)
                             channel_cleans_dir = path.join(cleans_dir, dir_element)
                             channel_text_dir = path.join(text_dir, dir_element)
+                            channel_words_dir = path.join(words_dir, dir_element)
 
                             channel_dir_list = [dir_element for dir_element in listdir(channel_in_dir)]
                             if '.DS_Store' in channel_dir_list:
                                 channel_dir_list.remove('.DS_Store')
                             for j, fn in enumerate(channel_dir_list):
-                                self.clean_captions(j, fn, langcode, channel_in_dir, channel_cleans_dir, channel_text_dir, self.text, self.overwrite)
+                                self.clean_captions(j, fn, langcode, channel_in_dir, channel_cleans_dir, channel_text_dir, self.text, self.overwrite, channel_words_dir)
                         else:
-                            self.clean_captions(i, dir_element, langcode, in_dir, cleans_dir, text_dir, self.text, self.overwrite)
+                            self.clean_captions(i, dir_element, langcode, in_dir, cleans_dir, text_dir, self.text, self.overwrite, words_dir)
+
+        self.manifest.save()
 
     def convert_to_seconds(self, timestamp):
         """ Translate timestamps to time in seconds (used in get_lines )
         """
-        time_components = findall(r'(\d{2}):(\d{2}):(\d{2}),(\d{3})', timestamp)
-
-        if not len(time_components) == 0:
-            hrs, mins, secs, msecs = time_components[0]
-
-            hrs = int(hrs) * (60 * 60) * 1000
-            mins = int(mins) * 60 * 1000
-            secs = int(secs) * 1000
-            msecs = int(msecs)
-
-            time_ms = hrs + mins + secs + msecs
-            time_s = float(time_ms)/float(1000)
-            return time_s
+        return Captions.timestamp_to_ms(timestamp) / 1000
 
     def clean_text(self, text, langcode):
         """ Automated cleaning of text.
@@ -1124,18 +1221,19 @@ class CaptionCleaner:
     def get_timestamped_lines(self, in_dir, fn, langcode):
         """ Extract timestamps and text per caption line
         """
+        timed_lines = []
         with open(path.join(in_dir,fn)) as file:
-            file_text = file.read()
 
-            # Extract only the relevant parts of each time+text set
-            subs = findall(r'\d+\n(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})\n(.*)\n', file_text)
+            # Read XML captions directly (no SRT round trip); otherwise stream SRT/VTT cues
+            if path.splitext(fn)[1].lower() == '.xml':
+                cues = Captions.iter_xml_cues(file.read())
+            else:
+                cues = Captions.iter_cues(file)
 
-        timed_lines = []
-        for line in subs:
-            time_start_s = self.convert_to_seconds(line[0])
-            time_end_s = self.convert_to_seconds(line[1])
-            sub_text = self.clean_text(line[2], langcode)
-            timed_lines.append((time_start_s, time_end_s, sub_text))
+            # Multi-line cues are joined into one line
+            for start_ms, end_ms, text in cues:
+                sub_text = self.clean_text(" ".join(line.strip() for line in text.split('\n')), langcode)
+                timed_lines.append((start_ms / 1000, end_ms / 1000, sub_text))
 
         lasti = len(timed_lines)
         corrected_timed_lines = []
@@ -1175,13 +1273,39 @@ class CaptionCleaner:
         else:
             print('File type is not valid (cleans, text).')
 
-    def clean_captions(self, i, fn, langcode, in_dir, cleans_dir, text_dir, text=False, overwrite=False):
+    def write_word_timings(self, in_dir, fn, words_dir, name, langcode):
+        """ Save the per-word start times of an XML caption track next to its cleaned output
+        """
+        with open(path.join(in_dir, fn)) as file:
+            xml_captions = file.read()
+
+        words = [(start_ms, self.clean_text(word, langcode)) for start_ms, word in Captions.iter_xml_words(xml_captions)]
+
+        if not path.exists(words_dir):
+            makedirs(words_dir)
+        Captions.save_word_timings(path.join(words_dir, name+'.npz'), words)
+
+    def clean_captions(self, i, fn, langcode, in_dir, cleans_dir, text_dir, text=False, overwrite=False, words_dir=None):
         name, ext = path.splitext(fn)
 
-        if path.isdir(cleans_dir):
-            existing_files = glob(path.join(cleans_dir, "**", "*{0}*".format(name)), recursive=True)
-            if existing_files:
-                return 1
+        # Word timings are only available from XML captions
+        if ext.lower() != '.xml':
+            words_dir = None
+
+        if name.rsplit('_', 1)[-1] in self.duplicates:
+            print('Skipping duplicate transcript {0}: {1}'.format(i+1,fn))
+            return 1
+
+        raw_path  = path.join(in_dir, fn)
+        out_paths = [path.join(cleans_dir, name+'.txt')]
+        if text:
+            out_paths.append(path.join(text_dir, name+'.txt'))
+        if words_dir:
+            out_paths.append(path.join(words_dir, name+'.npz'))
+
+        # Skip files whose recorded outputs are up to date with their contents and the cleaning rules
+        if self.manifest.is_current(raw_path, out_paths):
+            return 1
 
         print('Processing transcript {0}: {1}'.format(i+1,fn))
 
@@ -1189,3 +1313,696 @@ class CaptionCleaner:
         self.write_to_output('cleans', cleans_dir, name, timed_lines)
         if text:
             self.write_to_output('text', text_dir, name, timed_lines)
+        if words_dir:
+            self.write_word_timings(in_dir, fn, words_dir, name, langcode)
+
+        self.manifest.update(raw_path, out_paths)
+
+
+class CaptionExporter:
+
+    def __init__(self, group="ungrouped", lang_code=None, overwrite=False, row_group_size=10000):
+
+        self.group          = group
+        self.lang_code      = lang_code
+        self.overwrite      = overwrite
+        self.row_group_size = row_group_size
+
+        self.clean_sub_base = path.join('corpus', 'cleaned_subtitles', self.group)
+        self.corpus_base    = path.join('corpus', 'caption_corpus', self.group)
+
+        if self.overwrite:
+            try:
+                shutil.rmtree(self.corpus_base)
+            except FileNotFoundError as e:
+                pass
+
+
+    def process_captions(self):
+        """Pack the cleaned captions of every channel in the group into one Parquet file per channel.
+        Files are partitioned as caption_type=$type/lang_code=$lang/channel=$channel/cues.parquet
+        """
+
+        channel_count = 0
+        for sub_type in ['auto', 'manual', 'corrected']:
+
+            clean_sub_dir = path.join(self.clean_sub_base, sub_type)
+
+            if self.lang_code:
+                lang_code_list = [self.lang_code]
+            elif path.isdir(clean_sub_dir):
+                lang_code_list = [langcode for langcode in listdir(clean_sub_dir) if not langcode.startswith('.')]
+            else:
+                lang_code_list = []
+
+            for langcode in lang_code_list:
+
+                cleans_dir = path.join(clean_sub_dir, langcode, "cleans")
+                if not path.isdir(cleans_dir):
+                    continue
+
+                for channel in sorted(listdir(cleans_dir)):
+                    channel_dir = path.join(cleans_dir, channel)
+                    if channel.startswith('.') or not path.isdir(channel_dir):
+                        continue
+
+                    out_dir = path.join(self.corpus_base, "caption_type="+sub_type, "lang_code="+langcode, "channel="+channel)
+                    channel_count += self.export_channel(channel_dir, out_dir)
+
+        print("Exported {0} channels to {1}".format(channel_count, self.corpus_base))
+
+
+    def is_exported(self, channel_dir, fns, out_path):
+        """Check whether a channel's Parquet file is newer than all of its cleaned caption files.
+        """
+
+        if not path.isfile(out_path):
+            return False
+
+        export_time = stat(out_path).st_mtime_ns
+
+        # The directory's mtime changes when files are added or removed
+        if stat(channel_dir).st_mtime_ns > export_time:
+            return False
+
+        return all(stat(path.join(channel_dir, fn)).st_mtime_ns <= export_time for fn in fns)
+
+
+    def export_channel(self, channel_dir, out_dir):
+        """Read all cleaned caption files for a channel and write their cues to a single Parquet file.
+
+        :return success: 1 if the channel was (re-)exported, 0 if it was up to date
+        """
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            logging.critical("Exporting a caption corpus requires pyarrow (pip install pyarrow)")
+            raise
+
+        fns = sorted(fn for fn in listdir(channel_dir) if fn.endswith('.txt'))
+        out_path = path.join(out_dir, 'cues.parquet')
+
+        if self.is_exported(channel_dir, fns, out_path):
+            return 0
+
+        print('Exporting {0} transcripts from {1}'.format(len(fns), channel_dir))
+
+        videos, cues, starts, ends, texts = [], [], [], [], []
+        for fn in fns:
+            video_id = path.splitext(fn)[0]
+
+            for cue, (start_ms, end_ms, text) in enumerate(Captions.iter_clean_cues(path.join(channel_dir, fn))):
+                videos.append(video_id)
+                cues.append(cue)
+                starts.append(start_ms)
+                ends.append(end_ms)
+                texts.append(text)
+
+        table = pa.table({"video": pa.array(videos, pa.string()),
+                          "cue": pa.array(cues, pa.int32()),
+                          "start_ms": pa.array(starts, pa.int64()),
+                          "end_ms": pa.array(ends, pa.int64()),
+                          "text": pa.array(texts, pa.string())})
+
+        if not path.exists(out_dir):
+            makedirs(out_dir)
+
+        # Rows are sorted by video, so small row groups let readers skip to one video using column statistics
+        tmp_path = path.join(out_dir, '.cues.parquet.tmp') # Hidden from dataset readers until complete
+        pq.write_table(table, tmp_path, row_group_size=self.row_group_size)
+        replace(tmp_path, out_path)
+
+        return 1
+
+
+class CaptionIndexer:
+
+    # Characters of scripts written without spaces between words (kana, Han, and Thai), indexed as character bigrams
+    UNSPACED_CHARS = "\u0e00-\u0e7f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f"
+
+    # Bumped when text is split into terms differently, so that older indexes are rebuilt
+    INDEX_VERSION = 1
+
+    def __init__(self, group="ungrouped", lang_code=None, overwrite=False):
+
+        self.group     = group
+        self.lang_code = lang_code
+        self.overwrite = overwrite
+
+        self.clean_sub_base = path.join('corpus', 'cleaned_subtitles', self.group)
+        self.index_dir      = path.join('corpus', 'caption_index', self.group)
+        self.index_path     = path.join(self.index_dir, 'index.sqlite')
+
+        if self.overwrite and path.isfile(self.index_path):
+            remove(self.index_path)
+
+        if not path.exists(self.index_dir):
+            makedirs(self.index_dir)
+
+        self.db = sqlite3.connect(self.index_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.init_tables()
+
+
+    def init_tables(self):
+        """Create the index tables if they don't exist, dropping those of an index that splits text into terms
+        differently. Postings are clustered by term, so looking up a term reads one contiguous range.
+        """
+
+        with self.db:
+            if self.db.execute("PRAGMA user_version").fetchone()[0] != self.INDEX_VERSION:
+                if self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'videos'").fetchone():
+                    print("The caption index was built by an older version and has been cleared; rebuild it with -i")
+                for table in ["postings", "cues", "videos"]:
+                    self.db.execute("DROP TABLE IF EXISTS {0}".format(table))
+                self.db.execute("PRAGMA user_version = {0}".format(self.INDEX_VERSION))
+
+            self.db.execute("CREATE TABLE IF NOT EXISTS videos (video_id INTEGER PRIMARY KEY, path TEXT UNIQUE, caption_type TEXT, lang_code TEXT, channel TEXT, video TEXT, size INTEGER, mtime_ns INTEGER)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS cues (video_id INTEGER, cue INTEGER, start_ms INTEGER, end_ms INTEGER, text TEXT, PRIMARY KEY (video_id, cue)) WITHOUT ROWID")
+            self.db.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT, video_id INTEGER, cue INTEGER, position INTEGER, PRIMARY KEY (term, video_id, cue, position)) WITHOUT ROWID")
+            self.db.execute("CREATE INDEX IF NOT EXISTS postings_video ON postings (video_id)")
+
+
+    def tokenize(self, text, query=False):
+        """Split text into lowercase terms: words, or in scripts written without spaces (e.g., Japanese), overlapping
+        character bigrams, so that any run of characters can be searched for as a phrase of bigrams. In the index, each
+        such run also ends with its last character alone, so that single characters can be found; a query's runs of
+        two or more characters leave it out, to match inside longer runs.
+        """
+
+        terms = []
+        for run in findall("[{0}]+|(?:(?![{0}])\\w)+".format(self.UNSPACED_CHARS), text.casefold()):
+            if not fullmatch("[{0}]+".format(self.UNSPACED_CHARS), run):
+                terms.append(run)
+                continue
+            terms += [run[i:i+2] for i in range(len(run) - 1)]
+            if not query or len(run) == 1:
+                terms.append(run[-1])
+
+        return terms
+
+
+    def find_clean_files(self):
+        """List all cleaned caption files in the group.
+
+        :return clean_files: List of (caption_type, lang_code, channel, video, file path) tuples
+        """
+
+        clean_files = []
+        for sub_type in ['auto', 'manual', 'corrected']:
+
+            clean_sub_dir = path.join(self.clean_sub_base, sub_type)
+
+            if self.lang_code:
+                lang_code_list = [self.lang_code]
+            elif path.isdir(clean_sub_dir):
+                lang_code_list = [langcode for langcode in listdir(clean_sub_dir) if not langcode.startswith('.')]
+            else:
+                lang_code_list = []
+
+            for langcode in lang_code_list:
+
+                cleans_dir = path.join(clean_sub_dir, langcode, "cleans")
+                if not path.isdir(cleans_dir):
+                    continue
+
+                for channel in sorted(listdir(cleans_dir)):
+                    channel_dir = path.join(cleans_dir, channel)
+                    if channel.startswith('.') or not path.isdir(channel_dir):
+                        continue
+
+                    for fn in sorted(listdir(channel_dir)):
+                        if fn.endswith('.txt'):
+                            clean_files.append((sub_type, langcode, channel, path.splitext(fn)[0], path.join(channel_dir, fn)))
+
+        return clean_files
+
+
+    def remove_video(self, video_id):
+
+        self.db.execute("DELETE FROM postings WHERE video_id = ?", (video_id,))
+        self.db.execute("DELETE FROM cues WHERE video_id = ?", (video_id,))
+        self.db.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
+
+
+    def index_file(self, caption_type, langcode, channel, video, fp, file_stat):
+        """Add the cues and term postings of one cleaned caption file to the index.
+        """
+
+        cursor = self.db.execute("INSERT INTO videos (path, caption_type, lang_code, channel, video, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (fp, caption_type, langcode, channel, video, file_stat.st_size, file_stat.st_mtime_ns))
+        video_id = cursor.lastrowid
+
+        cues, postings = [], set()
+        for cue, (start_ms, end_ms, text) in enumerate(Captions.iter_clean_cues(fp)):
+            cues.append((video_id, cue, start_ms, end_ms, text))
+            for position, term in enumerate(self.tokenize(text)):
+                postings.add((term, video_id, cue, position))
+
+        self.db.executemany("INSERT INTO cues VALUES (?, ?, ?, ?, ?)", cues)
+        self.db.executemany("INSERT INTO postings VALUES (?, ?, ?, ?)", postings)
+
+
+    def update_index(self):
+        """Index new and changed cleaned caption files and drop deleted ones.
+        Unchanged files (same size and modification time) are skipped.
+        """
+
+        indexed = {fp: (video_id, size, mtime_ns) for video_id, fp, size, mtime_ns in self.db.execute("SELECT video_id, path, size, mtime_ns FROM videos")}
+
+        added_count, removed_count = 0, 0
+        with self.db:
+            for (caption_type, langcode, channel, video, fp) in self.find_clean_files():
+
+                file_stat = stat(fp)
+                previous = indexed.pop(fp, None)
+
+                if previous is not None:
+                    if previous[1:] == (file_stat.st_size, file_stat.st_mtime_ns):
+                        continue
+                    self.remove_video(previous[0])
+
+                self.index_file(caption_type, langcode, channel, video, fp, file_stat)
+                added_count += 1
+
+            # Only remove files that disappeared from the language folders we looked at
+            for fp, (video_id, size, mtime_ns) in indexed.items():
+                if self.lang_code is None or path.join(self.lang_code, "cleans") in fp:
+                    self.remove_video(video_id)
+                    removed_count += 1
+
+        print("Indexed {0} new or changed transcripts; removed {1} deleted transcripts".format(added_count, removed_count))
+
+
+    def search(self, query, channel=None, caption_type=None, limit=-1):
+        """Find all cues containing a word or phrase. Phrases must occur within a single cue.
+
+        :param query: A word or phrase
+        :param channel: Restrict results to a channel
+        :param caption_type: Restrict results to "auto", "manual", or "corrected" captions
+        :param limit: Maximum number of cues to return; if -1, return all matches
+
+        :return matches: List of (caption_type, lang_code, channel, video, cue, start_ms, end_ms, text) tuples
+        """
+
+        terms = self.tokenize(query, query=True)
+        if not terms:
+            return []
+
+        # Each further term must directly follow the previous one in the same cue
+        joins, params = [], []
+        for i, term in enumerate(terms[1:], 1):
+            joins.append("JOIN postings p{0} ON p{0}.term = ? AND p{0}.video_id = p0.video_id AND p{0}.cue = p0.cue AND p{0}.position = p0.position + {0}".format(i))
+            params.append(term)
+
+        # A single character of a script written without spaces is found at the start of any bigram
+        if len(terms) == 1 and len(terms[0]) == 1 and fullmatch("[{0}]".format(self.UNSPACED_CHARS), terms[0]):
+            first_term = "p0.term >= ? AND p0.term < ?"
+            params += [terms[0], terms[0] + "\U0010ffff"]
+        else:
+            first_term = "p0.term = ?"
+            params.append(terms[0])
+
+        sql = ("SELECT v.caption_type, v.lang_code, v.channel, v.video, c.cue, c.start_ms, c.end_ms, c.text "
+               "FROM (SELECT DISTINCT p0.video_id, p0.cue FROM postings p0 {0} WHERE {1}) m "
+               "JOIN videos v ON v.video_id = m.video_id JOIN cues c ON c.video_id = m.video_id AND c.cue = m.cue").format(" ".join(joins), first_term)
+
+        conditions = []
+        for column, value in [("v.lang_code", self.lang_code), ("v.channel", channel), ("v.caption_type", caption_type)]:
+            if value is not None:
+                conditions.append("{0} = ?".format(column))
+                params.append(value)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+
+        sql += " ORDER BY v.channel, v.video, c.cue LIMIT ?"
+        params.append(limit)
+
+        return self.db.execute(sql, params).fetchall()
+
+
+class CaptionStats:
+
+    # Rough memory cost of one counted n-gram (key tuple, strings, and dict entry), used to apply the memory budget
+    BYTES_PER_NGRAM = 200
+
+    def __init__(self, group="ungrouped", lang_code=None, max_n=3, workers=1, memory=512, shard_size=100):
+
+        self.group      = group
+        self.lang_code  = lang_code
+        self.max_n      = max_n
+        self.workers    = workers
+        self.shard_size = shard_size
+
+        # Each worker spills its counts to disk once it holds this many distinct n-grams
+        self.max_entries = max(1, (memory * 1024 * 1024) // (self.BYTES_PER_NGRAM * max(1, workers)))
+
+        self.clean_sub_base = path.join('corpus', 'cleaned_subtitles', self.group)
+        self.stats_base     = path.join('corpus', 'caption_stats', self.group)
+
+
+    @staticmethod
+    def count_shard(fns, max_n, max_entries, run_dir):
+        """Count 1- to MAX_N-grams over a list of text files, spilling sorted partial counts to disk
+        whenever the counter exceeds MAX_ENTRIES. Runs in a worker process.
+
+        :return run_fps: Paths to the sorted run files
+        """
+
+        run_fps = []
+        counts = Counter()
+
+        def spill():
+            fd, run_fp = tempfile.mkstemp(suffix='.tsv', dir=run_dir)
+            with open(fd, 'w') as run_out:
+                for (n, ngram), count in sorted(counts.items()):
+                    run_out.write("{0}\t{1}\t{2}\n".format(n, ngram, count))
+            run_fps.append(run_fp)
+            counts.clear()
+
+        for fn in fns:
+            with open(fn, 'r') as text_in:
+                tokens = findall(r"\w+", text_in.read().casefold())
+
+            for n in range(1, max_n + 1):
+                counts.update((n, " ".join(tokens[i:i+n])) for i in range(len(tokens) - n + 1))
+
+            if len(counts) > max_entries:
+                spill()
+
+        if counts:
+            spill()
+
+        return run_fps
+
+
+    def read_run(self, run_fp):
+        """Stream (n, ngram, count) rows from a sorted run or frequency table.
+        """
+
+        with open(run_fp, 'r') as run_in:
+            for line in run_in:
+                n, ngram, count = line.rstrip('\n').split('\t')
+                if n == 'n': # Header
+                    continue
+                yield (int(n), ngram, int(count))
+
+
+    def merge_runs(self, run_fps, out_fp):
+        """Merge sorted runs into a single frequency table, summing the counts of identical n-grams.
+        Only one row per run is held in memory.
+
+        :return num_ngrams: Number of distinct n-grams written
+        """
+
+        num_ngrams = 0
+        tmp_fp = out_fp + '.tmp'
+        with open(tmp_fp, 'w') as table_out:
+            table_out.write("n\tngram\tcount\n")
+
+            current, total = None, 0
+            for n, ngram, count in heapq.merge(*[self.read_run(run_fp) for run_fp in run_fps]):
+                if (n, ngram) != current:
+                    if current is not None:
+                        table_out.write("{0}\t{1}\t{2}\n".format(current[0], current[1], total))
+                        num_ngrams += 1
+                    current, total = (n, ngram), 0
+                total += count
+
+            if current is not None:
+                table_out.write("{0}\t{1}\t{2}\n".format(current[0], current[1], total))
+                num_ngrams += 1
+
+        replace(tmp_fp, out_fp)
+
+        return num_ngrams
+
+
+    def find_text_files(self):
+        """Group the cleaned text files in the group by caption type, language, and channel.
+
+        :return text_files: Dictionary of (caption_type, lang_code) to a dictionary of channel to file paths
+        """
+
+        text_files = {}
+        for sub_type in ['auto', 'manual', 'corrected']:
+
+            clean_sub_dir = path.join(self.clean_sub_base, sub_type)
+
+            if self.lang_code:
+                lang_code_list = [self.lang_code]
+            elif path.isdir(clean_sub_dir):
+                lang_code_list = [langcode for langcode in listdir(clean_sub_dir) if not langcode.startswith('.')]
+            else:
+                lang_code_list = []
+
+            for langcode in lang_code_list:
+
+                texts_dir = path.join(clean_sub_dir, langcode, "texts")
+                if not path.isdir(texts_dir):
+                    continue
+
+                for channel in sorted(listdir(texts_dir)):
+                    channel_dir = path.join(texts_dir, channel)
+                    if channel.startswith('.') or not path.isdir(channel_dir):
+                        continue
+
+                    fns = sorted(path.join(channel_dir, fn) for fn in listdir(channel_dir) if fn.endswith('.txt'))
+                    if fns:
+                        text_files.setdefault((sub_type, langcode), {})[channel] = fns
+
+        return text_files
+
+
+    def process_captions(self):
+        """Write n-gram frequency tables (n, ngram, count; sorted by n and n-gram) for each channel and for the whole group.
+        Tables are saved under caption_stats/$group/$caption_type/$lang_code
+        """
+
+        text_files = self.find_text_files()
+        if not text_files:
+            print("No cleaned text files found. Did you run 3-clean-captions.py with -t?")
+            return
+
+        for (sub_type, langcode), channels in text_files.items():
+
+            out_dir = path.join(self.stats_base, sub_type, langcode)
+            channel_out_dir = path.join(out_dir, "channels")
+            if not path.exists(channel_out_dir):
+                makedirs(channel_out_dir)
+
+            run_dir = tempfile.mkdtemp(prefix='.runs', dir=out_dir)
+
+            try:
+                # Shard each channel's files so that large channels are spread over several workers
+                shards = [(channel, fns[i:i+self.shard_size]) for channel, fns in channels.items() for i in range(0, len(fns), self.shard_size)]
+
+                channel_runs = {channel: [] for channel in channels}
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    futures = [(channel, executor.submit(CaptionStats.count_shard, fns, self.max_n, self.max_entries, run_dir)) for channel, fns in shards]
+                    for channel, future in futures:
+                        channel_runs[channel] += future.result()
+
+                channel_fps = []
+                for channel, run_fps in channel_runs.items():
+                    channel_fp = path.join(channel_out_dir, "{0}_ngrams.tsv".format(channel))
+                    num_ngrams = self.merge_runs(run_fps, channel_fp)
+                    channel_fps.append(channel_fp)
+                    print("{0}: {1} files, {2} distinct n-grams".format(channel, len(channels[channel]), num_ngrams))
+
+                    for run_fp in run_fps:
+                        remove(run_fp)
+
+                group_fp = path.join(out_dir, "{0}_ngrams.tsv".format(self.group))
+                num_ngrams = self.merge_runs(channel_fps, group_fp)
+                print("{0} ({1}, {2}): {3} distinct n-grams saved to {4}".format(self.group, sub_type, langcode, num_ngrams, group_fp))
+
+            finally:
+                shutil.rmtree(run_dir, ignore_errors=True)
+
+
+class DuplicateDetector:
+
+    # Mersenne prime for the MinHash permutations (a * x + b) mod p; products stay below 2^62
+    PRIME = (1 << 31) - 1
+
+    def __init__(self, group="ungrouped", lang_code=None, cleaned=False, threshold=0.8, shingle_size=5, num_perm=128, bands=16, screen=False):
+
+        self.group        = group
+        self.lang_code    = lang_code
+        self.cleaned      = cleaned
+        self.threshold    = threshold
+        self.shingle_size = shingle_size
+        self.num_perm     = num_perm
+        self.bands        = bands
+        self.rows         = num_perm // bands
+
+        if self.cleaned:
+            self.captions_base = path.join('corpus', 'cleaned_subtitles', self.group)
+        elif screen:
+            self.captions_base = path.join('corpus', 'unscreened_videos', self.group, 'subtitles')
+        else:
+            self.captions_base = path.join('corpus', 'raw_subtitles', self.group)
+
+        log_out_dir = path.join('corpus', 'unscreened_videos', 'logs') if screen else path.join('corpus', 'logs')
+        self.log_out_path = path.join(log_out_dir, "{0}_log.csv".format(self.group))
+
+        rng = np.random.RandomState(1)
+        self.perm_a = rng.randint(1, self.PRIME, size=(self.num_perm, 1)).astype(np.uint64)
+        self.perm_b = rng.randint(0, self.PRIME, size=(self.num_perm, 1)).astype(np.uint64)
+
+
+    def find_caption_files(self):
+        """List caption files by caption type and language.
+
+        :return caption_files: Dictionary of (caption_type, lang_code) to a list of (yt_id, file path) tuples
+        """
+
+        caption_files = {}
+        for sub_type in ['auto', 'manual']:
+
+            sub_dir = path.join(self.captions_base, sub_type)
+
+            if self.lang_code:
+                lang_code_list = [self.lang_code]
+            elif path.isdir(sub_dir):
+                lang_code_list = [langcode for langcode in listdir(sub_dir) if not langcode.startswith('.')]
+            else:
+                lang_code_list = []
+
+            for langcode in lang_code_list:
+
+                # Cleaned captions are nested one level deeper (cleans/$channel)
+                lang_dir = path.join(sub_dir, langcode, "cleans") if self.cleaned else path.join(sub_dir, langcode)
+                fps = glob(path.join(lang_dir, "*", "*.*"))
+
+                for fp in sorted(fps):
+                    name, ext = path.splitext(path.basename(fp))
+                    if ext.lower() in ['.srt', '.vtt', '.xml', '.txt']:
+                        caption_files.setdefault((sub_type, langcode), []).append((name.rsplit('_', 1)[-1], fp))
+
+        return caption_files
+
+
+    def read_text(self, fp):
+        """Read the caption text of a raw or cleaned caption file.
+        """
+
+        if self.cleaned:
+            cues = Captions.iter_clean_cues(fp)
+        else:
+            cues = Captions.read_cues(fp)
+
+        return " ".join(text for start_ms, end_ms, text in cues)
+
+
+    def get_signature(self, text):
+        """Compute the MinHash signature of a text's word shingles.
+
+        :return signature: uint64 array of NUM_PERM minimum hash values, or None if the text has no shingles
+        """
+
+        tokens = findall(r"\w+", text.casefold())
+        k = self.shingle_size
+        shingles = {" ".join(tokens[i:i+k]) for i in range(max(1, len(tokens) - k + 1))} if tokens else set()
+        if not shingles:
+            return None
+
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) & self.PRIME for shingle in shingles), dtype=np.uint64, count=len(shingles))
+
+        return ((self.perm_a * hashes + self.perm_b) % self.PRIME).min(axis=1)
+
+
+    def find_clusters(self, signatures):
+        """Group near-duplicate videos using locality-sensitive hashing on signature bands.
+        Candidate pairs share at least one band and are kept if their estimated Jaccard similarity reaches the threshold.
+
+        :param signatures: Dictionary of yt_id to (signature, shingle count)
+        :return clusters: List of lists of yt_ids, each with two or more videos
+        """
+
+        parent = {yt_id: yt_id for yt_id in signatures}
+
+        def find(yt_id):
+            while parent[yt_id] != yt_id:
+                parent[yt_id] = parent[parent[yt_id]]
+                yt_id = parent[yt_id]
+            return yt_id
+
+        checked = set()
+        for band in range(self.bands):
+            buckets = {}
+            for yt_id, signature in signatures.items():
+                key = signature[band*self.rows:(band+1)*self.rows].tobytes()
+                buckets.setdefault(key, []).append(yt_id)
+
+            for bucket in buckets.values():
+                for i, yt_id in enumerate(bucket):
+                    for other_id in bucket[i+1:]:
+                        if (yt_id, other_id) in checked:
+                            continue
+                        checked.add((yt_id, other_id))
+                        similarity = np.mean(signatures[yt_id] == signatures[other_id])
+                        if similarity >= self.threshold:
+                            parent[find(other_id)] = find(yt_id)
+
+        clusters = {}
+        for yt_id in signatures:
+            clusters.setdefault(find(yt_id), []).append(yt_id)
+
+        return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+
+    def update_log(self, duplicate_of):
+        """Flag duplicates in the group log with the yt_id of their cluster's representative (empty otherwise).
+        """
+
+        if not path.isfile(self.log_out_path):
+            logging.critical("Could not find group log {0}".format(self.log_out_path))
+            return
+
+        with open(self.log_out_path, 'r', newline='') as log_in:
+            log_reader = DictReader(log_in)
+            fieldnames = [field for field in log_reader.fieldnames if field != "duplicate_of"] + ["duplicate_of"]
+            rows = list(log_reader)
+
+        for row in rows:
+            row["duplicate_of"] = duplicate_of.get(row["yt_id"], "")
+            row.pop(None, None) # Extra fields from rows appended after an earlier run
+
+        with open(self.log_out_path, 'w', newline='') as log_out:
+            log_writer = DictWriter(log_out, fieldnames=fieldnames)
+            log_writer.writeheader()
+            log_writer.writerows(rows)
+
+
+    def process_captions(self):
+        """Find clusters of near-identical caption tracks and flag all but one representative per cluster
+        (the video with the most text) in the group log, so later stages can skip them.
+        """
+
+        duplicate_of = {}
+        for (sub_type, langcode), caption_files in self.find_caption_files().items():
+
+            signatures, lengths = {}, {}
+            for yt_id, fp in caption_files:
+                text = self.read_text(fp)
+                signature = self.get_signature(text)
+                if signature is not None:
+                    signatures[yt_id] = signature
+                    lengths[yt_id] = len(text)
+
+            clusters = self.find_clusters(signatures)
+            for cluster in clusters:
+                representative = max(sorted(cluster), key=lambda yt_id: lengths[yt_id])
+                for yt_id in cluster:
+                    if yt_id != representative and yt_id not in duplicate_of:
+                        duplicate_of[yt_id] = representative
+
+            print("{0} ({1}): {2} caption files, {3} duplicate clusters".format(sub_type, langcode, len(caption_files), len(clusters)))
+
+        self.update_log(duplicate_of)
+        print("Flagged {0} duplicate videos in {1}".format(len(duplicate_of), self.log_out_path))
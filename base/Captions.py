@@ -0,0 +1,350 @@
+# Captions.py
+
+# Lightweight caption readers shared by the base, youdep, and youspeak scripts.
+# Only depends on the standard library and numpy, so that it can be imported
+# without the scraping dependencies needed by Base.
+
+import re
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+
+from csv import reader, DictReader
+from html import unescape
+from os import path
+
+
+# Languages written without spaces between words: their captions are handled character by character
+UNSPACED_LANGUAGES = ['ja', 'zh', 'zh-hans', 'zh-hant', 'th']
+
+# A word, keeping apostrophes inside it (e.g., "don't"), or a single punctuation mark
+TOKEN_PATTERN = re.compile(r"\w+(?:['’]\w+)*|[^\w\s]")
+
+
+def timestamp_to_ms(timestamp):
+    """Convert an SRT ("00:01:02,345") or VTT ("00:01:02.345" or "01:02.345") timestamp to milliseconds.
+
+    :param timestamp: The timestamp string
+    :return time_ms: Time in milliseconds
+    """
+
+    # Fast path for fixed-width HH:MM:SS,mmm timestamps
+    if len(timestamp) == 12 and timestamp[2] == ':' and timestamp[5] == ':':
+        return (int(timestamp[0:2]) * 3600000 + int(timestamp[3:5]) * 60000
+                + int(timestamp[6:8]) * 1000 + int(timestamp[9:12]))
+
+    clock, _, fraction = timestamp.strip().replace(',', '.').partition('.')
+
+    seconds = 0
+    for component in clock.split(':'):
+        seconds = seconds * 60 + int(component)
+
+    return seconds * 1000 + (int(fraction[:3].ljust(3, '0')) if fraction else 0)
+
+
+def iter_cues(lines):
+    """Stream cues from an SRT or WebVTT caption file, one cue at a time.
+    Cue numbers and VTT headers, notes, and styles are skipped; multi-line cues are kept whole.
+
+    :param lines: An iterable of lines (e.g., an open caption file)
+    :return cues: Generator of (start_ms, end_ms, text) tuples, where multi-line text is joined by newlines
+    """
+
+    start_ms, end_ms, text = None, None, []
+
+    for line in lines:
+        line = line.strip().lstrip('\ufeff')
+
+        if not line:
+            if start_ms is not None:
+                yield (start_ms, end_ms, "\n".join(text))
+            start_ms, end_ms, text = None, None, []
+            continue
+
+        if '-->' in line:
+            if start_ms is not None:
+                # Missing blank line between cues: a trailing number belongs to the new cue
+                if text and text[-1].isdigit():
+                    text.pop()
+                yield (start_ms, end_ms, "\n".join(text))
+            start, _, end = line.partition('-->')
+            start_ms = timestamp_to_ms(start.strip())
+            end_ms = timestamp_to_ms(end.split()[0])
+            text = []
+
+        elif start_ms is not None:
+            text.append(line)
+
+        # Anything else before a timing line is a cue number, a cue identifier, or a VTT header/NOTE/STYLE block
+
+    if start_ms is not None:
+        yield (start_ms, end_ms, "\n".join(text))
+
+
+def iter_xml_cues(xml_captions):
+    """Read cues directly from a YouTube XML caption track, with times taken from the "t" and "d" attributes (ms).
+
+    :param xml_captions: XML formatted caption track
+    :return cues: Generator of (start_ms, end_ms, text) tuples
+    """
+
+    try:
+        root = ElementTree.fromstring(xml_captions)[1]
+    except IndexError as e:
+        root = ElementTree.fromstring(xml_captions)[0]
+
+    for child in list(root):
+        if child.tag == 'p':
+            caption = ''
+            if len(list(child))==0:
+                caption = child.text
+                if not caption or not caption.strip():
+                    continue
+            else:
+                for s in list(child):
+                    if s.tag == 's':
+                        caption += ' ' + s.text
+            caption = unescape(caption.replace("\n", " ").replace("  ", " "),)
+            if not caption.strip():
+                continue
+            try:
+                duration = round(float(child.attrib["d"]))
+            except KeyError:
+                duration = 0
+            start = round(float(child.attrib["t"]))
+            yield (start, start + duration, caption)
+
+
+def iter_xml_words(xml_captions):
+    """Read word-level timings from a YouTube XML caption track. Auto-captions split each cue into <s> elements
+    whose "t" attribute is an offset (ms) from the start of the cue; manual captions have no word timings.
+
+    :param xml_captions: XML formatted caption track
+    :return words: Generator of (start_ms, word) tuples with absolute start times
+    """
+
+    try:
+        root = ElementTree.fromstring(xml_captions)[1]
+    except IndexError as e:
+        root = ElementTree.fromstring(xml_captions)[0]
+
+    for child in list(root):
+        if child.tag == 'p':
+            cue_start = round(float(child.attrib["t"]))
+            for s in list(child):
+                if s.tag == 's' and s.text:
+                    word = unescape(s.text).strip()
+                    if word:
+                        yield (cue_start + round(float(s.attrib.get("t", 0))), word)
+
+
+def split_cue_tokens(text, by_char=False):
+    """Split a cue's text into tokens (words, or characters for languages written without spaces).
+
+    :return tokens: List of tokens
+    :return line_starts: Set of the token indices at which the cue's lines start
+    """
+
+    tokens, line_starts = [], set()
+    for line in text.split("\n"):
+        line_starts.add(len(tokens))
+        tokens += [char for char in line if not char.isspace()] if by_char else line.split()
+
+    return (tokens, line_starts)
+
+
+def tokenize_lines(text):
+    """Split text into tokens line by line, separating punctuation from words, for parsers that take each line as
+    a sentence that is already tokenized.
+
+    :param text: Lines of text written with spaces between words
+    :return sentences: List of token lists, one per line that has any tokens
+    """
+
+    return [tokens for tokens in (TOKEN_PATTERN.findall(line) for line in text.split("\n")) if tokens]
+
+
+def rolling_overlap(previous, previous_line_starts, tokens, line_starts):
+    """Find how many of a cue's first tokens repeat the end of the previous cue as whole lines: from the start of one
+    of the previous cue's lines, to the end of one of the cue's lines. Rolling repeats whole lines, so a cue "no"
+    followed by a cue "no way" repeats nothing. The prefix function of the cue, a separator, and the previous cue gives
+    every prefix of the cue that the previous cue ends with, in time linear in their lengths.
+
+    :return overlap: Number of repeated tokens at the start of TOKENS
+    """
+
+    if not previous or not tokens:
+        return 0
+
+    sequence = tokens + [None] + previous
+    prefix = [0] * len(sequence)
+    for i in range(1, len(sequence)):
+        k = prefix[i - 1]
+        while k and sequence[i] != sequence[k]:
+            k = prefix[k - 1]
+        if sequence[i] == sequence[k]:
+            k += 1
+        prefix[i] = k
+
+    # Longest repeat of whole lines (shorter ones are its borders)
+    overlap = prefix[-1]
+    while overlap and (len(previous) - overlap not in previous_line_starts or (overlap not in line_starts and overlap != len(tokens))):
+        overlap = prefix[overlap - 1]
+
+    return overlap
+
+
+def deroll_cues(cues, by_char=False):
+    """Undo the rolling format of YouTube auto-captions, in which each cue repeats the last line (or all) of the
+    previous cue before adding new words, so that each spoken token is kept once, with the timing of the cue
+    that introduced it. A cue that repeats the whole previous cue adds nothing, even if the speaker said it twice.
+
+    :param cues: Iterable of (start_ms, end_ms, text) tuples, in time order
+    :param by_char: Match characters instead of words (for languages written without spaces)
+    :return cues: Generator of (start_ms, end_ms, tokens) tuples, with only the new tokens of each cue
+    """
+
+    previous, previous_line_starts = [], set()
+    for start_ms, end_ms, text in cues:
+        tokens, line_starts = split_cue_tokens(text, by_char)
+        if not tokens:
+            continue
+
+        overlap = rolling_overlap(previous, previous_line_starts, tokens, line_starts)
+        if overlap < len(tokens):
+            yield (start_ms, end_ms, tokens[overlap:])
+
+        previous, previous_line_starts = tokens, line_starts
+
+
+def read_cues(fp):
+    """Read all cues from an SRT, WebVTT, or YouTube XML caption file.
+
+    :return cues: List of (start_ms, end_ms, text) tuples
+    """
+
+    with open(fp, 'r') as captions_in:
+        if fp.endswith('.xml'):
+            return list(iter_xml_cues(captions_in.read()))
+        return list(iter_cues(captions_in))
+
+
+def iter_clean_cues(fp):
+    """Stream cues from a cleaned caption file written by CaptionCleaner (tab-separated start, end, and text).
+
+    :param fp: Path to a file in cleaned_subtitles/.../cleans
+    :return cues: Generator of (start_ms, end_ms, text) tuples
+    """
+
+    # Same dialect as the files written by CaptionCleaner.write_to_output (pandas to_csv)
+    with open(fp, 'r', newline='') as cleans_in:
+        for row in reader(cleans_in, delimiter='\t'):
+            if len(row) < 3:
+                continue
+            yield (round(float(row[0]) * 1000), round(float(row[1]) * 1000), row[2])
+
+
+def cues_to_arrays(cues):
+    """Pack cues into compact numpy arrays.
+
+    :param cues: Iterable of (start_ms, end_ms, text) tuples
+    :return start_ms: int64 array of cue start times in milliseconds
+    :return end_ms: int64 array of cue end times in milliseconds
+    :return text: Unicode array of cue texts
+    """
+
+    cues = list(cues)
+
+    start_ms = np.fromiter((cue[0] for cue in cues), dtype=np.int64, count=len(cues))
+    end_ms = np.fromiter((cue[1] for cue in cues), dtype=np.int64, count=len(cues))
+    text = np.array([cue[2] for cue in cues], dtype=str)
+
+    return (start_ms, end_ms, text)
+
+
+def read_corpus_cues(corpus_dir, video_id, channel=None, caption_type=None, lang_code=None):
+    """Read one video's cues from a caption corpus exported by base/5-export-captions.py.
+    Partition keys prune whole files and the video filter is pushed down to Parquet row group statistics,
+    so only the matching rows are read. Requires pyarrow.
+
+    :param corpus_dir: The group's corpus folder (e.g., corpus/caption_corpus/$group)
+    :param video_id: The video's file name without extension (e.g., $channel_$yt_id)
+    :param channel: Restrict to a channel partition (e.g., $channel_name_$channel_id)
+    :param caption_type: Restrict to "auto", "manual", or "corrected" captions
+    :param lang_code: Restrict to a language code
+
+    :return cues: pyarrow Table with caption_type, lang_code, channel, video, cue, start_ms, end_ms, and text columns
+    """
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([('caption_type', pa.string()), ('lang_code', pa.string()), ('channel', pa.string())]), flavor='hive')
+    dataset = ds.dataset(corpus_dir, format='parquet', partitioning=partitioning)
+
+    condition = ds.field('video') == video_id
+    for key, value in [('channel', channel), ('caption_type', caption_type), ('lang_code', lang_code)]:
+        if value is not None:
+            condition = condition & (ds.field(key) == value)
+
+    return dataset.to_table(filter=condition)
+
+
+def save_word_timings(fp, words):
+    """Save word timings as compact numpy arrays (an .npz file with "start_ms" and "word" arrays).
+
+    :param fp: Output path (.npz)
+    :param words: Iterable of (start_ms, word) tuples, in time order
+    """
+
+    words = list(words)
+
+    start_ms = np.fromiter((word[0] for word in words), dtype=np.int64, count=len(words))
+    word = np.array([word[1] for word in words], dtype=str)
+
+    # Stable sort guards against slightly out-of-order cues so that binary search stays valid
+    order = np.argsort(start_ms, kind='stable')
+    np.savez_compressed(fp, start_ms=start_ms[order], word=word[order])
+
+
+def read_word_timings(fp):
+    """Load word timings saved by save_word_timings.
+
+    :return start_ms: int64 array of word start times in milliseconds
+    :return word: Unicode array of words
+    """
+
+    with np.load(fp) as word_timings:
+        return (word_timings["start_ms"], word_timings["word"])
+
+
+def words_between(start_ms, word, begin_ms, end_ms):
+    """Find the words that start within a time window by binary search.
+
+    :param start_ms: Sorted word start times from read_word_timings
+    :param word: Words from read_word_timings
+    :param begin_ms: Window start (inclusive) in milliseconds
+    :param end_ms: Window end (exclusive) in milliseconds
+
+    :return words: List of words in time order
+    """
+
+    first, last = np.searchsorted(start_ms, [begin_ms, end_ms], side='left')
+    return word[first:last].tolist()
+
+
+def read_duplicates(group, screen=False):
+    """Read the videos flagged as near-duplicates by base/8-find-duplicates.py from a group log.
+
+    :param group: The name of the group
+    :param screen: Read the unscreened group log instead
+    :return duplicates: Set of yt_ids to skip (cluster representatives are not included)
+    """
+
+    log_dir = path.join('corpus', 'unscreened_videos', 'logs') if screen else path.join('corpus', 'logs')
+    log_fp = path.join(log_dir, "{0}_log.csv".format(group))
+
+    if not path.isfile(log_fp):
+        return set()
+
+    with open(log_fp, 'r', newline='') as log_in:
+        return {row["yt_id"] for row in DictReader(log_in) if row.get("duplicate_of")}
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# bench_cleaning.py
+
+# Time each caption cleaning entry point, stage by stage, on a synthetic corpus of noisy
+# auto-captions: CaptionCleaner (base/3-clean-captions.py) and youdep/1-clean-captions-auto.py.
+# Results are reported per language and per MB, and saved as JSON for regression checks.
+
+import argparse, importlib.util, io, json, platform, tempfile, time
+from contextlib import redirect_stdout
+from datetime import datetime
+from os import path, chdir, getcwd
+from shutil import rmtree
+from sys import path as sys_path
+
+BASE_DIR = path.join(path.dirname(path.abspath(__file__)), "..", "base")
+YOUDEP_DIR = path.join(path.dirname(path.abspath(__file__)), "..", "youdep")
+
+sys_path.append(BASE_DIR)
+import Captions
+
+from synthetic import write_synthetic_corpus
+
+
+def load_caption_cleaner():
+    """Import Base for CaptionCleaner (requires the scraping dependencies).
+    """
+    import Base
+    return Base.CaptionCleaner
+
+
+def load_youdep_cleaner():
+    """Import youdep/1-clean-captions-auto.py as a module.
+    """
+    spec = importlib.util.spec_from_file_location("clean_captions_auto", path.join(YOUDEP_DIR, "1-clean-captions-auto.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_lines(fp):
+    with open(fp) as captions_in:
+        return list(captions_in)
+
+
+def time_stage(stage, repeat):
+    """Run STAGE (a function of no arguments) REPEAT times.
+
+    :return seconds: The fastest run
+    :return count: The number of lines reported by the stage
+    """
+
+    best, count = float("inf"), 0
+    for i in range(repeat):
+        start = time.perf_counter()
+        # Silence per-file progress messages
+        with redirect_stdout(io.StringIO()):
+            count = stage()
+        best = min(best, time.perf_counter() - start)
+
+    return (best, count)
+
+
+def base_stages(CaptionCleaner, work_dir, group, files):
+    """Stages of CaptionCleaner for one language: parsing, text cleaning, writing, and the full run.
+    """
+
+    def make_cleaner():
+        # overwrite=True removes previous outputs (and the manifest), so every run cleans everything
+        return CaptionCleaner(group, files[0][0], True, True)
+
+    cleaner = make_cleaner()
+    cues = [list(Captions.iter_cues(read_lines(fp))) for lang, fp in files]
+    timed_lines = [cleaner.get_timestamped_lines(path.dirname(fp), path.basename(fp), lang) for lang, fp in files]
+    out_dir = path.join(work_dir, "bench_out")
+
+    def parse():
+        return sum(len(list(Captions.iter_cues(read_lines(fp)))) for lang, fp in files)
+
+    def clean_text():
+        count = 0
+        for (lang, fp), file_cues in zip(files, cues):
+            for start_ms, end_ms, text in file_cues:
+                cleaner.clean_text(" ".join(line.strip() for line in text.split('\n')), lang)
+                count += 1
+        return count
+
+    def get_timestamped_lines():
+        return sum(len(cleaner.get_timestamped_lines(path.dirname(fp), path.basename(fp), lang)) for lang, fp in files)
+
+    def write_cleans():
+        for i, lines in enumerate(timed_lines):
+            cleaner.write_to_output('cleans', out_dir, "file{0}".format(i), lines)
+        return sum(len(lines) for lines in timed_lines)
+
+    def write_text():
+        for i, lines in enumerate(timed_lines):
+            cleaner.write_to_output('text', out_dir, "file{0}".format(i), lines)
+        return sum(len(lines) for lines in timed_lines)
+
+    def process_captions():
+        cleaner = make_cleaner()
+        cleaner.process_captions()
+        return sum(len(lines) for lines in timed_lines)
+
+    return [("parse", parse), ("clean_text", clean_text), ("get_timestamped_lines", get_timestamped_lines),
+            ("write_cleans", write_cleans), ("write_text", write_text), ("process_captions", process_captions)]
+
+
+def youdep_stages(youdep, files):
+    """Stages of youdep/1-clean-captions-auto.py for one language: parsing, normalization, and the full run.
+    """
+
+    lang = files[0][0]
+    fps = [fp for lang, fp in files]
+    caption_lines = [list(youdep.get_caption_lines(read_lines(fp))) for fp in fps]
+
+    def normalize(lines):
+        if lang == 'ja':
+            return youdep.process_captions_ja(lines)
+        return youdep.process_captions(lines, "BenchChannel", lang)
+
+    def get_caption_lines():
+        return sum(len(list(youdep.get_caption_lines(read_lines(fp)))) for fp in fps)
+
+    def process_captions():
+        return sum(len(list(normalize(lines))) for lines in caption_lines)
+
+    def process_caption_files():
+        youdep.process_caption_files("BenchChannel", lang, fps, 0, -1, "bench", auto=True)
+        return sum(len(lines) for lines in caption_lines)
+
+    return [("get_caption_lines", get_caption_lines), ("process_captions", process_captions), ("process_caption_files", process_caption_files)]
+
+
+def main(args):
+
+    langs = args.languages.split(",")
+    work_dir = tempfile.mkdtemp(prefix="lingtube_bench_")
+    cwd = getcwd()
+
+    results = []
+    try:
+        # The cleaners read and write relative to the corpus folder
+        chdir(work_dir)
+        files = [(lang, path.relpath(fp, work_dir)) for lang, fp in write_synthetic_corpus(path.join(work_dir, "corpus"), "bench", langs, args.size, args.cues, args.noise)]
+        print("Synthetic corpus: {0} files, {1:.1f} MB, languages {2}, noise {3}".format(len(files), sum(path.getsize(fp) for lang, fp in files) / (1024 * 1024), ",".join(langs), args.noise))
+
+        entry_points = []
+        try:
+            CaptionCleaner = load_caption_cleaner()
+            for lang in langs:
+                lang_files = [(file_lang, fp) for file_lang, fp in files if file_lang == lang]
+                entry_points.append(("CaptionCleaner", lang, lang_files, base_stages(CaptionCleaner, work_dir, "bench", lang_files)))
+        except ImportError as e:
+            print("Skipping CaptionCleaner: {0}".format(e))
+
+        try:
+            youdep = load_youdep_cleaner()
+            for lang in langs:
+                lang_files = [(file_lang, fp) for file_lang, fp in files if file_lang == lang]
+                entry_points.append(("1-clean-captions-auto", lang, lang_files, youdep_stages(youdep, lang_files)))
+        except ImportError as e:
+            print("Skipping 1-clean-captions-auto: {0}".format(e))
+
+        print("{0:<22} {1:<4} {2:<22} {3:>9} {4:>9} {5:>11}".format("entry point", "lang", "stage", "seconds", "MB/s", "lines/s"))
+        for entry_point, lang, lang_files, stages in entry_points:
+            size_mb = sum(path.getsize(fp) for file_lang, fp in lang_files) / (1024 * 1024)
+            for stage, run in stages:
+                seconds, lines = time_stage(run, args.repeat)
+                results.append({"entry_point": entry_point, "lang": lang, "stage": stage, "files": len(lang_files), "mb": round(size_mb, 3),
+                                "seconds": round(seconds, 4), "mb_per_s": round(size_mb / seconds, 3), "lines": lines, "lines_per_s": round(lines / seconds, 1)})
+                print("{0:<22} {1:<4} {2:<22} {3:>9.3f} {4:>9.2f} {5:>11.0f}".format(entry_point, lang, stage, seconds, size_mb / seconds, lines / seconds))
+    finally:
+        chdir(cwd)
+        rmtree(work_dir, ignore_errors=True)
+
+    report = {"date": datetime.now().isoformat(timespec='seconds'),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "config": {"languages": langs, "size_mb": args.size, "cues_per_file": args.cues, "noise": args.noise, "repeat": args.repeat},
+              "results": results}
+
+    with open(args.output, 'w') as json_out:
+        json.dump(report, json_out, indent=2, ensure_ascii=False)
+    print("Saved results to {0}".format(args.output))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark caption cleaning stages on a synthetic corpus of noisy auto-captions.')
+
+    parser.add_argument('-s', '--size', default=10, type=float, metavar='MB', help='approximate size of the synthetic corpus in MB')
+    parser.add_argument('-l', '--languages', default="en,ja,ko", type=str, help='comma-separated language codes to mix (en, ja, ko)')
+    parser.add_argument('-n', '--cues', default=1000, type=int, help='number of cues per caption file')
+    parser.add_argument('-z', '--noise', default=0.2, type=float, help='probability of each kind of noise (emoji, music symbols, speaker labels, sounds, numbers, HTML) per line')
+    parser.add_argument('-r', '--repeat', default=3, type=int, help='number of timed runs per stage (best is reported)')
+    parser.add_argument('-o', '--output', default="bench_cleaning.json", type=str, help='JSON file to save results to')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# bench_deroll.py
+
+# Time the de-rolling of YouTube-style rolling auto-captions in base/Captions.py (used by
+# youdep/1-clean-captions-auto.py) on a large synthetic file, and check that it keeps each spoken
+# word exactly once, both there and on small cases such as a speaker repeating a word across cues.
+
+import argparse, random, tempfile, time
+from os import path, remove
+from sys import exit, path as sys_path
+
+sys_path.append(path.join(path.dirname(path.abspath(__file__)), "..", "base"))
+import Captions
+
+from synthetic import ms_to_srt, make_line
+
+
+# (description, cue texts, language, expected tokens)
+CASES = [
+    ("rolling lines", ["so today", "so today\nwe are going", "we are going", "we are going\nto talk"], "en",
+     ["so", "today", "we", "are", "going", "to", "talk"]),
+    ("repeated word across cues", ["no", "no way"], "en", ["no", "no", "way"]),
+    ("repeated word after a rolled line", ["we are going", "we are going\ngoing home"], "en", ["we", "are", "going", "going", "home"]),
+    ("repeated cue (dropped as rolling)", ["yes", "yes"], "en", ["yes"]),
+    ("rolling characters", ["今日は", "今日は\n皆さん", "皆さん"], "ja", list("今日は皆さん")),
+    ("repeated characters across cues", ["ね", "ねえ"], "ja", ["ね", "ね", "え"]),
+]
+
+
+def write_rolling_srt(fp, num_phrases, lang="en", seed=0):
+    """Write a synthetic file in the rolling format of YouTube auto-captions: each phrase is shown under the previous
+    one, then alone for a moment before the next phrase rolls in.
+
+    :return words: The spoken tokens, in order
+    """
+
+    rng = random.Random(seed)
+    by_char = lang in Captions.UNSPACED_LANGUAGES
+
+    words, previous, time_ms, cue = [], None, 0, 0
+    with open(fp, 'w') as srt_out:
+        for i in range(num_phrases):
+            phrase = make_line(rng, lang, 0)
+            words += Captions.split_cue_tokens(phrase, by_char)[0]
+
+            duration = rng.randint(800, 4000)
+            for text, cue_ms in [(phrase if previous is None else previous + "\n" + phrase, duration), (phrase, 10)]:
+                cue += 1
+                srt_out.write("{0}\n{1} --> {2}\n{3}\n\n".format(cue, ms_to_srt(time_ms), ms_to_srt(time_ms + cue_ms), text))
+                time_ms += cue_ms
+
+            previous = phrase
+
+    return words
+
+
+def deroll(cues, by_char):
+    return [token for start_ms, end_ms, tokens in Captions.deroll_cues(cues, by_char) for token in tokens]
+
+
+def main(args):
+
+    failed = 0
+    for description, texts, lang, expected in CASES:
+        tokens = deroll([(i * 1000, i * 1000 + 1000, text) for i, text in enumerate(texts)], lang in Captions.UNSPACED_LANGUAGES)
+        print("{0:<36} {1}".format(description, "ok" if tokens == expected else "FAILED: {0}".format(" ".join(tokens))))
+        failed += tokens != expected
+
+    for lang in args.languages.split(","):
+
+        by_char = lang in Captions.UNSPACED_LANGUAGES
+        fd, fp = tempfile.mkstemp(suffix=".srt")
+        words = write_rolling_srt(fp, args.phrases, lang)
+        with open(fp) as captions_in:
+            cues = list(Captions.iter_cues(captions_in))
+        remove(fp)
+
+        best, tokens = float("inf"), None
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            tokens = deroll(cues, by_char)
+            best = min(best, time.perf_counter() - start)
+
+        print("{0}: {1} cues, {2} tokens shown, {3} spoken, {4} kept in {5:.2f}s ({6:.0f} cues/s), {7}".format(
+            lang, len(cues), sum(len(Captions.split_cue_tokens(text, by_char)[0]) for start_ms, end_ms, text in cues),
+            len(words), len(tokens), best, len(cues) / best, "identical" if tokens == words else "DIFFERS"))
+        failed += tokens != words
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark and check the de-rolling of rolling auto-captions.')
+
+    parser.add_argument('-n', '--phrases', default=20000, type=int, help='number of phrases per language')
+    parser.add_argument('-l', '--languages', default="en,ja,ko", type=str, help='comma-separated language codes (en, ja, ko)')
+    parser.add_argument('-r', '--repeat', default=3, type=int, help='number of timed runs per language (best is reported)')
+
+    args = parser.parse_args()
+
+    exit(main(args))
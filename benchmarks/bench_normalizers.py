@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+# bench_normalizers.py
+
+# Compare the lines-per-second throughput of the precompiled caption normalizers in
+# youdep/1-clean-captions-auto.py with the per-line regex cleaning they replaced, on large
+# synthetic auto-caption sets. Both must produce identical output.
+
+import argparse, importlib.util, re, tempfile, time
+from os import path, remove
+
+from emoji import get_emoji_regexp
+
+from synthetic import write_synthetic_srt
+
+
+YOUDEP_DIR = path.join(path.dirname(path.abspath(__file__)), "..", "youdep")
+
+
+def load_youdep_cleaner():
+    spec = importlib.util.spec_from_file_location("clean_captions_auto", path.join(YOUDEP_DIR, "1-clean-captions-auto.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def remove_emoji(text):
+    return get_emoji_regexp().sub(u'', text)
+
+
+def process_captions_legacy(captions, channel, language):
+    """The previous process_captions: emoji regexp lookup and about ten uncompiled re.sub calls per line.
+    """
+    for line in captions:
+
+        if line:
+
+            line = remove_emoji(line.strip())
+            line = line.replace(":D", "")
+            line = line.replace(":)", "")
+
+            line = re.sub(r'\([^)]*\)', '', line) # Remove parens
+            line = re.sub(r'<[^)]*>', '', line)   # Remove HTML
+            line = re.sub("[\\\/\^\_~-♫♡♥♪→↑↖↓←⇓\(\)\[\]☆★♬\n]", "", line)
+            line = re.sub("[!?]", ".", line)
+            line = re.sub("^( )*\-", "", line)
+            ine = re.sub(" \- ", ' ', line)
+            line = re.sub("\.\.\.", ".", line)
+            line = re.sub("\.\.", ".", line)
+            line = line.strip()
+
+            if line:
+                if(channel != "AdvokatEgorov"):
+                    if(line[-1] != '.' and line[-1] != ','):
+                        line += '.'
+                no_attr = re.split("[:]", line)
+                if len(no_attr) > 1:
+                    no_attr = "".join(no_attr[1:])
+                    if(language != "ko"):
+                        no_attr = no_attr.capitalize()
+                    yield (no_attr)
+                else:
+                    if(language != "ko"):
+                        line = line.capitalize()
+                    yield line
+
+
+def process_captions_ja_legacy(captions):
+    """The previous process_captions_ja: a loop over seven parenthesis patterns and several replaces per line.
+    """
+    for line in captions:
+        if line:
+                line = line.strip()
+                line = remove_emoji(line)
+
+                line = re.sub("[！‼？!?.…]", "。", line)
+                line = line.replace("～", "")
+                line = line.replace("〜", "")
+                line = line.replace("、、、", "。")
+
+                parentheses = ["（[^（）]*）", "〔[^〔〕]*〕", "\([^()]*\)", "\[[^\[\]]*\]", "【[^【】)]*】", "＜[^＜＞)]*＞", "｛[｛｝)]*｝"]
+                for paren_type in parentheses:
+                    line = re.sub(paren_type, "", line)
+
+                line = re.sub(r'<[^)]*>', '', line)
+
+                if not line:
+                    continue
+
+                attr_typos = [(" ：", "："), (" ）","）"), (" )", ")")]
+                for typo, correction in attr_typos:
+                    line = line.replace(typo, correction)
+
+                line_noattr = re.sub("[^\s　。、]+[）\):：;)≫>]", "。", line)
+
+                if(line_noattr == line):
+                    if line[-1] == "」" or (line.find("「") > -1 and line.find("」") == -1):
+                        line = re.sub("^[^\s]+「", "。", line).replace("」", "")
+                else:
+                    line = line_noattr
+
+                line = re.sub("[（\(](.*)", "", line)
+
+                line = re.sub("[●<>・･‥／☆\s♫♡♥♪♪→↑↖↓←”✖wｗWｗＷ※⇓⇒()（）【】《》✖「」『』〈〉]*", "", line)
+
+                line = re.sub("。+", "。", line)
+                line = re.sub("^。", "", line)
+
+                if line:
+                    if(line[-1] != '。' and line[-1] != '、'):
+                        line += '。'
+                    yield line
+                else:
+                    continue
+
+
+def time_normalizer(normalize, lines, repeat):
+    best, output = float("inf"), None
+    for i in range(repeat):
+        start = time.perf_counter()
+        output = list(normalize(lines))
+        best = min(best, time.perf_counter() - start)
+
+    return (best, output)
+
+
+def main(args):
+
+    youdep = load_youdep_cleaner()
+
+    for lang in args.languages.split(","):
+
+        fd, fp = tempfile.mkstemp(suffix=".srt")
+        write_synthetic_srt(fp, args.cues, 0.3, lang, args.noise)
+        with open(fp) as captions_in:
+            lines = list(youdep.get_caption_lines(captions_in))
+        remove(fp)
+
+        if lang == 'ja':
+            before = process_captions_ja_legacy
+            after = youdep.process_captions_ja
+        else:
+            before = lambda captions: process_captions_legacy(captions, "BenchChannel", lang)
+            after = lambda captions: youdep.process_captions(captions, "BenchChannel", lang)
+
+        before_seconds, before_output = time_normalizer(before, lines, args.repeat)
+        after_seconds, after_output = time_normalizer(after, lines, args.repeat)
+
+        print("{0}: {1} lines, before {2:.0f} lines/s, after {3:.0f} lines/s ({4:.1f}x), output {5}".format(
+            lang, len(lines), len(lines) / before_seconds, len(lines) / after_seconds, before_seconds / after_seconds,
+            "identical" if before_output == after_output else "DIFFERS"))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark caption line normalization before and after precompiling the cleaning rules.')
+
+    parser.add_argument('-n', '--cues', default=100000, type=int, help='number of cues per language')
+    parser.add_argument('-l', '--languages', default="en,ja,ko", type=str, help='comma-separated language codes (en, ja, ko)')
+    parser.add_argument('-z', '--noise', default=0.2, type=float, help='probability of each kind of noise per line')
+    parser.add_argument('-r', '--repeat', default=3, type=int, help='number of timed runs per normalizer (best is reported)')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# bench_pretokenized.py
+
+# Compare Stanza parsing throughput per language with the neural tokenizer and with the
+# pre-tokenized fast path of youdep/2-parse-captions.py (-p), which takes each caption line
+# as a sentence and splits it into words and punctuation marks, and report how many of the
+# tokenizer's sentences the fast path parses the same. Lines come from processed captions in
+# a corpus folder, or else from the synthetic vocabularies.
+
+import argparse, random, time
+from collections import Counter
+from glob import glob
+from os import path
+from sys import path as sys_path
+
+import stanza
+
+sys_path.append(path.join(path.dirname(path.abspath(__file__)), "..", "base"))
+import Captions
+
+from synthetic import make_line
+
+
+def read_lines(corpus, lang, num_lines):
+    """Read up to NUM_LINES caption lines for LANG, from processed captions if CORPUS is given.
+    """
+
+    if corpus:
+        lines = []
+        for fn in sorted(glob(path.join(corpus, "processed_subtitles", "*", lang, "*", "*.srt"))):
+            with open(fn, "r") as subtitles_in:
+                lines += [line for line in subtitles_in if line.strip()]
+            if len(lines) >= num_lines:
+                break
+        return lines[:num_lines]
+
+    rng = random.Random(0)
+    return [make_line(rng, lang, 0) + ".\n" for i in range(num_lines)]
+
+
+def time_pipeline(nlp, lines, lines_per_doc, repeat, pretokenized):
+    """Parse LINES in documents of LINES_PER_DOC lines, as 2-parse-captions.py parses files.
+
+    :return seconds: The fastest run
+    :return parses: Parsed sentences of the last run
+    """
+
+    docs = ["".join(lines[i:i+lines_per_doc]) for i in range(0, len(lines), lines_per_doc)]
+    if pretokenized:
+        docs = [Captions.tokenize_lines(doc) for doc in docs]
+
+    # Warm up
+    nlp(docs[0])
+
+    best, parses = float("inf"), []
+    for i in range(repeat):
+        start = time.perf_counter()
+        parses = [sentence for doc in docs for sentence in nlp(doc).to_dict()]
+        best = min(best, time.perf_counter() - start)
+
+    return (best, parses)
+
+
+def count_matches(parses, baseline):
+    """Count the sentences of BASELINE that are also in PARSES, with the same tokens, tags, heads, and relations.
+    """
+
+    def get_key(sentence):
+        return tuple((word.get("text"), word.get("upos"), word.get("head"), word.get("deprel")) for word in sentence)
+
+    found = Counter(get_key(sentence) for sentence in parses)
+    matches = 0
+    for sentence in baseline:
+        key = get_key(sentence)
+        if found[key]:
+            found[key] -= 1
+            matches += 1
+
+    return matches
+
+
+def main(args):
+
+    print("{0:<5} {1:<13} {2:>9} {3:>10} {4:>8} {5:>11} {6:>6} {7:>8}".format("lang", "mode", "seconds", "sentences", "tokens", "tokens/s", "gain", "matching"))
+    for lang in args.languages.split(","):
+
+        if lang in Captions.UNSPACED_LANGUAGES:
+            print("{0:<5} skipped: written without spaces, so always tokenized".format(lang))
+            continue
+
+        lines = read_lines(args.corpus, lang, args.lines)
+        if not lines:
+            print("{0:<5} skipped: no caption lines found".format(lang))
+            continue
+
+        options = {"processors": args.processors} if args.processors else {}
+
+        baseline, baseline_parses = None, None
+        for mode, pretokenized in [("tokenized", False), ("pretokenized", True)]:
+            nlp = stanza.Pipeline(lang=lang, use_gpu=args.gpu, tokenize_pretokenized=pretokenized, **options)
+            seconds, parses = time_pipeline(nlp, lines, args.lines_per_doc, args.repeat, pretokenized)
+            baseline = baseline or seconds
+            baseline_parses = baseline_parses or parses
+
+            # Share of the tokenizer's sentences parsed the same way
+            num_tokens = sum(len(sentence) for sentence in parses)
+            matching = count_matches(parses, baseline_parses) / max(len(baseline_parses), 1)
+
+            print("{0:<5} {1:<13} {2:>9.2f} {3:>10} {4:>8} {5:>11.0f} {6:>5.2f}x {7:>7.1%}".format(
+                lang, mode, seconds, len(parses), num_tokens, num_tokens / seconds, baseline / seconds, matching))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark Stanza parsing per language with and without the pre-tokenized fast path.')
+
+    parser.add_argument('-l', '--languages', default="en,ko", type=str, help='comma-separated language codes')
+    parser.add_argument('-c', '--corpus', default=None, type=str, help='corpus folder to read processed captions from (default: synthetic lines)')
+    parser.add_argument('-n', '--lines', default=2000, type=int, help='number of caption lines per language')
+    parser.add_argument('-d', '--lines_per_doc', default=200, type=int, help='caption lines per parsed document')
+    parser.add_argument('-p', '--processors', default=None, type=str, help='comma-separated Stanza processors to run (default: the language\'s default pipeline)')
+    parser.add_argument('-r', '--repeat', default=3, type=int, help='number of timed runs per mode (best is reported)')
+    parser.add_argument('--gpu', action='store_true', default=False, help='parse on the GPU')
+
+    args = parser.parse_args()
+
+    main(args)
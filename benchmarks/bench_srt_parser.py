@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+# bench_srt_parser.py
+
+# Compare the throughput of the streaming cue parser in base/Captions.py with the
+# regex-based SRT parsing that CaptionCleaner used previously, on a large synthetic file.
+
+import argparse, re, tempfile, time
+from os import path, remove
+from sys import path as sys_path
+
+sys_path.append(path.join(path.dirname(path.abspath(__file__)), "..", "base"))
+import Captions
+
+from synthetic import write_synthetic_srt
+
+
+def parse_legacy(fp):
+    """The previous CaptionCleaner parser: whole-file findall plus a regex per timestamp (drops multi-line text).
+    """
+
+    def convert_to_seconds(timestamp):
+        hrs, mins, secs, msecs = re.findall(r'(\d{2}):(\d{2}):(\d{2}),(\d{3})', timestamp)[0]
+        return float(int(hrs) * 3600000 + int(mins) * 60000 + int(secs) * 1000 + int(msecs)) / 1000
+
+    with open(fp) as file:
+        subs = re.findall(r'\d+\n(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})\n(.*)\n', file.read())
+
+    return [(convert_to_seconds(start), convert_to_seconds(end), text) for start, end, text in subs]
+
+
+def parse_streaming(fp):
+    with open(fp) as file:
+        return list(Captions.iter_cues(file))
+
+
+def parse_arrays(fp):
+    with open(fp) as file:
+        return Captions.cues_to_arrays(Captions.iter_cues(file))
+
+
+def time_parser(parser, fp, repeat):
+    best = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = parser(fp)
+        best = min(best, time.perf_counter() - start)
+
+    return (best, len(result) if isinstance(result, list) else len(result[0]))
+
+
+def main(args):
+
+    fd, fp = tempfile.mkstemp(suffix=".srt")
+    write_synthetic_srt(fp, args.cues, args.multiline)
+    size_mb = path.getsize(fp) / (1024 * 1024)
+
+    print("Synthetic SRT: {0} cues, {1:.1f} MB".format(args.cues, size_mb))
+
+    for name, parser in [("legacy regex", parse_legacy), ("iter_cues", parse_streaming), ("cues_to_arrays", parse_arrays)]:
+        seconds, num_cues = time_parser(parser, fp, args.repeat)
+        print("{0:<16} {1:>9.0f} cues/s {2:>7.1f} MB/s  ({3} cues)".format(name, num_cues / seconds, size_mb / seconds, num_cues))
+
+    remove(fp)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark SRT parsing throughput on a large synthetic caption file.')
+
+    parser.add_argument('-n', '--cues', default=500000, type=int, help='number of cues in the synthetic file')
+    parser.add_argument('-m', '--multiline', default=0.3, type=float, help='proportion of cues spanning two lines')
+    parser.add_argument('-r', '--repeat', default=3, type=int, help='number of timed runs per parser (best is reported)')
+
+    args = parser.parse_args()
+
+    main(args)
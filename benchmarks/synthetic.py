@@ -0,0 +1,125 @@
+# synthetic.py
+
+# Generate synthetic SRT caption files and corpora for the benchmarks. Text is drawn from small
+# English, Japanese, and Korean vocabularies, with optional noise of the kinds found in scraped
+# captions: emoji, music symbols, speaker labels, sound descriptions, HTML tags, and numbers.
+
+import random
+from os import path, makedirs
+
+
+WORDS = {
+    "en": ["so", "today", "we", "are", "going", "to", "talk", "about", "the", "new", "video", "and", "I", "think", "that", "really", "like", "this", "one", "guys"],
+    "ja": ["今日は", "皆さん", "こんにちは", "新しい", "動画", "です", "ね", "本当に", "美味しい", "ラーメン", "を", "食べ", "ました", "よ", "それでは", "行き", "ましょう", "私", "が", "とても"],
+    "ko": ["오늘은", "여러분", "안녕하세요", "새로운", "영상", "입니다", "정말", "맛있는", "라면을", "먹었어요", "그리고", "저는", "너무", "좋아요", "같이", "가볼까요", "이거", "진짜", "한번", "해볼게요"],
+}
+
+SEPARATORS = {"en": " ", "ja": "", "ko": " "}
+
+SPEAKERS = {
+    "en": ["JOHN:", "MARY:", "NARRATOR:", ">> HOST:"],
+    "ja": ["田中：", "（山田）", "【ナレーション】", "＞＞"],
+    "ko": ["진행자:", "(민수)", "[나레이션]", ">>"],
+}
+
+SOUNDS = {
+    "en": ["[Music]", "(laughs)", "[Applause]", "(inaudible)"],
+    "ja": ["（笑）", "［音楽］", "（拍手）", "【笑い】"],
+    "ko": ["(웃음)", "[음악]", "(박수)", "[효과음]"],
+}
+
+EMOJI = ["😂", "👍", "🎵", "❤️", "🔥", "😊", ":D", ":)"]
+MUSIC = ["♪", "♫", "♬", "♪♪", "～", "★"]
+NUMBERS = ["10", "25%", "3:00", "1.5", "24/7", "2021", "7", "99"]
+HTML = [("<i>", "</i>"), ("<b>", "</b>"), ("<font color=\"#E5E5E5\">", "</font>")]
+
+
+def ms_to_srt(ms):
+    return "{0:02d}:{1:02d}:{2:02d},{3:03d}".format(ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000)
+
+
+def make_line(rng, lang, noise):
+    """Make one caption line, adding each kind of noise with probability NOISE.
+    """
+
+    words = [rng.choice(WORDS[lang]) for i in range(rng.randint(3, 10))]
+
+    if noise:
+        if rng.random() < noise:
+            words.insert(rng.randint(0, len(words)), rng.choice(NUMBERS))
+        if rng.random() < noise:
+            words.append(rng.choice(EMOJI))
+        if rng.random() < noise:
+            symbol = rng.choice(MUSIC)
+            words = [symbol] + words + [symbol]
+
+    line = SEPARATORS[lang].join(words)
+
+    if noise:
+        if rng.random() < noise:
+            line = rng.choice(SPEAKERS[lang]) + " " + line
+        if rng.random() < noise:
+            line = line + " " + rng.choice(SOUNDS[lang])
+        if rng.random() < noise / 2:
+            open_tag, close_tag = rng.choice(HTML)
+            line = open_tag + line + close_tag
+
+    return line
+
+
+def write_synthetic_srt(fp, num_cues, multiline_rate=0.3, lang="en", noise=0.0, seed=0):
+    """Write a synthetic SRT file with NUM_CUES cues, some of which span two lines.
+
+    :param fp: Output path
+    :param num_cues: Number of cues
+    :param multiline_rate: Proportion of cues spanning two lines
+    :param lang: Vocabulary to draw from ("en", "ja", or "ko")
+    :param noise: Probability of each kind of noise per line (0 for clean text)
+    :param seed: Random seed
+    """
+
+    rng = random.Random(seed)
+    time_ms = 0
+    with open(fp, 'w') as srt_out:
+        for i in range(num_cues):
+            duration = rng.randint(800, 4000)
+            lines = [make_line(rng, lang, noise)]
+            if rng.random() < multiline_rate:
+                lines.append(make_line(rng, lang, noise))
+            srt_out.write("{0}\n{1} --> {2}\n{3}\n\n".format(i + 1, ms_to_srt(time_ms), ms_to_srt(time_ms + duration), "\n".join(lines)))
+            time_ms += duration
+
+
+def write_synthetic_corpus(corpus_dir, group, langs, size_mb, cues_per_file=1000, noise=0.2, seed=0):
+    """Write a synthetic group of auto-captions laid out like scraped captions
+    (corpus_dir/raw_subtitles/$group/auto/$lang/$channel/$channel_$channel_id_$yt_id.srt).
+
+    :param corpus_dir: The corpus folder to write into
+    :param group: The group name
+    :param langs: List of language codes, used in turn for each file
+    :param size_mb: Approximate total size of the corpus in MB
+    :param cues_per_file: Number of cues per caption file
+    :param noise: Probability of each kind of noise per line
+    :param seed: Random seed
+
+    :return caption_files: List of (lang_code, file path) tuples
+    """
+
+    caption_files = []
+    total_bytes = 0
+    i = 0
+    while total_bytes < size_mb * 1024 * 1024:
+        lang = langs[i % len(langs)]
+        channel = "Channel{0}_UC{1:04d}".format(lang.upper(), i % 3)
+        channel_dir = path.join(corpus_dir, "raw_subtitles", group, "auto", lang, channel)
+        if not path.exists(channel_dir):
+            makedirs(channel_dir)
+
+        fp = path.join(channel_dir, "{0}_vid{1:06d}.srt".format(channel, i))
+        write_synthetic_srt(fp, cues_per_file, 0.3, lang, noise, seed + i)
+
+        caption_files.append((lang, fp))
+        total_bytes += path.getsize(fp)
+        i += 1
+
+    return caption_files
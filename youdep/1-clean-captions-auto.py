@@ -3,19 +3,19 @@
 # Automatically fix common formatting errors and remove non-spoken material from captions.
 # May be used in place of 3-clean-captions.py in ../base.
  
-import re, logging
+import re, logging, sys
 
 from sys import argv, stdout, exit
 from argparse import ArgumentParser
 from os import path, makedirs, getcwd
 from glob import glob
-from stanza import Pipeline
-from random import shuffle
-from emoji import get_emoji_regexp
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from emoji import EMOJI_DATA
 
-
-def remove_emoji(text):
-    return get_emoji_regexp().sub(u'', text)
+# Shared caption readers live with the base scripts
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "..", "base"))
+import Captions
 
 
 def main(args):
@@ -34,14 +34,14 @@ def main(args):
         return
 
     if len(captions_fns_auto) != 0:
-        process_caption_files(args.channel, args.language, captions_fns_auto, args.start, args.end, args.group, auto=True)
+        process_caption_files(args.channel, args.language, captions_fns_auto, args.start, args.end, args.group, auto=True, workers=args.workers, deroll=not args.keep_rolling)
     if len(captions_fns_manual) != 0:
-        process_caption_files(args.channel, args.language, captions_fns_manual, args.start, args.end, args.group, auto=False)
+        process_caption_files(args.channel, args.language, captions_fns_manual, args.start, args.end, args.group, auto=False, workers=args.workers)
 
 
 # Clean up caption files
 # Processing differs based on the language specified
-def process_caption_files(channel, language, captions_fns, start, end, group=None, auto=False):
+def process_caption_files(channel, language, captions_fns, start, end, group=None, auto=False, workers=1, deroll=True):
 
     out_path = path.join("corpus", "processed_subtitles", "auto_processed")
 
@@ -60,131 +60,291 @@ def process_caption_files(channel, language, captions_fns, start, end, group=Non
     if not path.exists(out_path):
         makedirs(out_path)
 
-    video_count = 0
-    for captions_fn in captions_fns:
-        if video_count < start:
-            continue
-        if end != -1 and video_count > end:
-            break
+    # Windows are inclusive indices into the sorted file list (-1: to the end)
+    captions_fns = sorted(captions_fns)
+    window = captions_fns[start:] if end == -1 else captions_fns[start:end+1]
+    out_paths = [out_path] * len(window)
+
+    # Only auto-captions roll
+    derolls = [auto and deroll] * len(window)
+
+    if workers > 1:
+        # Each file is cleaned and written independently, so files can be sharded across processes
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            line_counts = list(executor.map(process_caption_file, window, out_paths, [channel] * len(window), [language] * len(window), derolls, chunksize=max(1, len(window) // (workers * 4))))
+    else:
+        line_counts = list(map(process_caption_file, window, out_paths, [channel] * len(window), [language] * len(window), derolls))
+
+    for captions_fn, line_count in zip(window, line_counts):
+        logging.info("Processed file: {0} ({1} lines)".format(captions_fn, line_count))
+
+    logging.info("Processed {0} files".format(len(window)))
+
+
+# Clean up a single caption file
+def process_caption_file(captions_fn, out_path, channel, language, deroll=False):
+
+    # Normalizers are cached, so each worker process builds them once
+    normalizer = get_normalizer(channel, language)
+
+    out_fn = "{0}_processed.txt".format(path.splitext(path.split(captions_fn)[1])[0])
+    words_fn = "{0}_processed_words.npz".format(path.splitext(path.split(captions_fn)[1])[0])
+
+    logging.info("Processing file: {0}".format(captions_fn))
+    logging.info("Output file: {0}".format(out_fn))
+
+    with open(captions_fn, "r") as captions_in:
+
+        if deroll:
+            caption_lines, words = get_derolled_lines(captions_in, language)
+        else:
+            caption_lines = get_caption_lines(captions_in)
+        processed_captions = list(normalizer.process(caption_lines))
+
+        logging.info("Found {0} lines".format(len(processed_captions)))
+
+        if len(processed_captions) != 0:
+            with open(path.join(out_path, out_fn + ".srt"), "w") as captions_out:
+                for line in processed_captions:
+                    captions_out.write(line + "\n")
+
+            # Word timings are only saved alongside the cleaned captions they belong to
+            if deroll:
+                Captions.save_word_timings(path.join(out_path, words_fn), words)
+
+    return len(processed_captions)
+
+
+# Yield the text lines of each cue, skipping cue numbers and timestamps
+def get_caption_lines(captions):
+    for start_ms, end_ms, text in Captions.iter_cues(captions):
+        for line in text.split("\n"):
+            yield line
 
-        out_fn = "{0}_processed.txt".format(path.splitext(path.split(captions_fn)[1])[0])
 
-        logging.info("Processing file: {0}".format(captions_fn))
-        logging.info("Output file: {0}".format(out_fn))
+def get_derolled_lines(captions, language):
+    """Undo the rolling two-line format of auto-captions, so that each spoken token is kept once: one line per cue
+    with only the tokens it adds.
 
-        with open(captions_fn, "r") as captions_in:
+    :return lines: List of caption lines
+    :return words: List of (cue start time, token) tuples, for Captions.save_word_timings
+    """
 
-            if language == 'ja':
-                processed_captions = list(process_captions_ja(captions_in))
+    by_char = language in Captions.UNSPACED_LANGUAGES
+    cues = list(Captions.deroll_cues(Captions.iter_cues(captions), by_char))
+
+    words = [(start_ms, token) for start_ms, end_ms, tokens in cues for token in tokens]
+
+    return ([("" if by_char else " ").join(tokens) for start_ms, end_ms, tokens in cues], words)
+
+
+# Characters removed from caption lines, mapped for str.translate
+# NOTE: "~-♫" in the original character class is a range (U+007E to U+266B), which also covers the arrows and
+# symbols listed after it, and is kept as is so that output does not change
+REMOVED_CHARS = "\\/^_()[]♬\n" + "".join(chr(c) for c in range(ord("~"), ord("♫") + 1))
+
+REMOVED_CHARS_JA = "●<>・･‥／☆♫♡♥♪→↑↖↓←”✖wｗWＷ※⇓⇒()（）【】《》「」『』〈〉"
+
+# All characters matched by \s (the last one is U+3000, the ideographic space)
+WHITESPACE = "".join(chr(c) for c in range(0x3001) if chr(c).isspace())
+
+
+class EmojiRemover:
+    """Remove emoji the way emoji.get_emoji_regexp().sub('', text) does (longest emoji first, left to right),
+    but only try the emoji that start with a candidate character instead of every emoji at every position.
+    """
+
+    def __init__(self):
+
+        self.emoji_by_first_char = {}
+        for emoji in sorted(EMOJI_DATA, key=len, reverse=True):
+            self.emoji_by_first_char.setdefault(emoji[0], []).append(emoji)
+
+        self.first_chars = frozenset(self.emoji_by_first_char)
+
+    def sub(self, text):
+
+        # Most lines have no candidate characters at all
+        if self.first_chars.isdisjoint(text):
+            return text
+
+        pieces, last, i = [], 0, 0
+        while i < len(text):
+            match = None
+            for emoji in self.emoji_by_first_char.get(text[i], ()):
+                if text.startswith(emoji, i):
+                    match = emoji
+                    break
+
+            if match:
+                pieces.append(text[last:i])
+                i = last = i + len(match)
             else:
-                processed_captions = list(process_captions(captions_in, channel, language))
+                i += 1
+
+        pieces.append(text[last:])
+        return "".join(pieces)
+
+
+class CaptionNormalizer:
+    """Remove non-spoken material from caption lines and fix their punctuation.
+    All patterns are compiled once; character removals are done in a single str.translate pass.
+    """
+
+    def __init__(self, channel, language):
+
+        self.channel  = channel
+        self.language = language
+
+        self.emoji_remover = EmojiRemover()
+        self.parens_regexp = re.compile(r'\([^)]*\)')
+        self.html_regexp = re.compile(r'<[^)]*>')
+        self.dash_regexp = re.compile(r'^( )*\-')
+
+        # Remove special characters and replace "!" and "?" with "."
+        self.char_table = str.maketrans("!?", "..", REMOVED_CHARS)
+
+    def process(self, captions):
+        for line in captions:
+            line = self.normalize(line)
+            if line is not None:
+                yield line
+
+    def normalize(self, line):
+        """Clean a single caption line.
+
+        :return line: The cleaned line, or None if nothing is left
+        """
+
+        if not line:
+            return None
+
+        line = self.emoji_remover.sub(line.strip())
+        line = line.replace(":D", "")
+        line = line.replace(":)", "")
+
+        line = self.parens_regexp.sub('', line) # Remove parens
+        line = self.html_regexp.sub('', line)   # Remove HTML
+        line = line.translate(self.char_table)
+        line = self.dash_regexp.sub('', line)
+        line = line.replace("...", ".")
+        line = line.replace("..", ".")
+        line = line.strip()
+
+        if not line:
+            return None
+
+        if(self.channel != "AdvokatEgorov"):
+            if(line[-1] != '.' and line[-1] != ','):
+                line += '.'
+        no_attr = line.split(":")
+        if len(no_attr) > 1:
+            line = "".join(no_attr[1:])
+        if(self.language != "ko"):
+            line = line.capitalize()
+
+        return line
+
+
+class JapaneseCaptionNormalizer(CaptionNormalizer):
+    """Remove non-spoken material from Japanese caption lines and fix their punctuation.
+    """
+
+    def __init__(self, channel, language='ja'):
+
+        self.channel  = channel
+        self.language = language
+
+        self.emoji_remover = EmojiRemover()
+
+        # Replace all punctuation except commas, and remove both kinds of wave dash (～ and 〜)
+        self.punct_table = str.maketrans("！‼？!?.…", "。。。。。。。", "～〜")
+
+        # Matched parentheticals, removed in this order
+        parentheses = ["（[^（）]*）", "〔[^〔〕]*〕", "\([^()]*\)", "\[[^\[\]]*\]", "【[^【】)]*】", "＜[^＜＞)]*＞", "｛[｛｝)]*｝"]
+        self.paren_regexps = [re.compile(paren_type) for paren_type in parentheses]
+
+        self.html_regexp = re.compile(r'<[^)]*>')
+        self.attr_regexp = re.compile("[^\s　。、]+[）\):：;)≫>]")
+        self.quote_attr_regexp = re.compile("^[^\s]+「")
+        self.action_regexp = re.compile("[（\(](.*)")
+        self.periods_regexp = re.compile("。+")
+
+        self.stray_table = str.maketrans("", "", REMOVED_CHARS_JA + WHITESPACE)
+
+    def normalize(self, line):
+
+        if not line:
+            return None
+
+        line = line.strip()
+        # Remove emoji
+        line = self.emoji_remover.sub(line)
+
+        line = line.translate(self.punct_table)
+        line = line.replace("、、、", "。") # Special case of ellipses
+
+        # Reomove text within matched parentheticals
+        for paren_regexp in self.paren_regexps:
+            line = paren_regexp.sub("", line)
+
+        # Remove HTML
+        line = self.html_regexp.sub('', line)
+
+        if not line:
+            return None
+
+        # Hacky fix for some troublesome whitespace typos
+        attr_typos = [(" ：", "："), (" ）","）"), (" )", ")")]
+        for typo, correction in attr_typos:
+            line = line.replace(typo, correction)
+
+        # Remove speaker attributions (NOTE: Depends on above fix)
+        line_noattr = self.attr_regexp.sub("。", line)
+
+        # Hacky solution for attributions using 「」
+        # Do best to prevent accidentally removing content outside 「」or
+        # when the 「」 isn't actually an attibution
+        if(line_noattr == line):
+            if line[-1] == "」" or (line.find("「") > -1 and line.find("」") == -1):
+                line = self.quote_attr_regexp.sub("。", line).replace("」", "")
+        else:
+            line = line_noattr
+
+        # Remove action text
+        line = self.action_regexp.sub("", line)
+
+        # Remove any stray special characters
+        line = line.translate(self.stray_table)
+
+        # Fixes for multiple & initial periods
+        line = self.periods_regexp.sub("。", line)
+        if line.startswith("。"):
+            line = line[1:]
+
+        if not line:
+            return None
+
+        if(line[-1] != '。' and line[-1] != '、'):
+            line += '。'
+        return line
 
-            logging.info("Found {0} lines".format(len(processed_captions)))
 
-            if len(processed_captions) != 0:
-                with open(path.join(out_path, out_fn + ".srt"), "w") as captions_out:
-                    for line in processed_captions:
-                        captions_out.write(line + "\n")
+NORMALIZERS = {'ja': JapaneseCaptionNormalizer}
 
-            video_count += 1
 
-    logging.info("Processed {0} files".format(video_count))
+# Normalizers are built once per channel and language
+@lru_cache(maxsize=None)
+def get_normalizer(channel, language):
+    return NORMALIZERS.get(language, CaptionNormalizer)(channel, language)
 
 
 def process_captions(captions, channel, language):
-    for line in captions:
-
-        if line and not re.search("^[0-9]([0-9:,\-\ >])*\n", line):
-
-            line = remove_emoji(line.strip())
-            line = line.replace(":D", "")
-            line = line.replace(":)", "")
-
-            line = re.sub(r'\([^)]*\)', '', line) # Remove parens
-            line = re.sub(r'<[^)]*>', '', line)   # Remove HTML
-            line = re.sub("[\\\/\^\_~-♫♡♥♪→↑↖↓←⇓\(\)\[\]☆★♬\n]", "", line)
-            line = re.sub("[!?]", ".", line)
-            line = re.sub("^( )*\-", "", line)
-            ine = re.sub(" \- ", ' ', line)
-            line = re.sub("\.\.\.", ".", line)
-            line = re.sub("\.\.", ".", line)
-            line = line.strip()
-
-            if line:
-                if(channel != "AdvokatEgorov"):
-                    if(line[-1] != '.' and line[-1] != ','):
-                        line += '.'
-                no_attr = re.split("[:]", line)
-                if len(no_attr) > 1:
-                    no_attr = "".join(no_attr[1:])
-                    if(language != "ko"):
-                        no_attr = no_attr.capitalize()
-                    yield (no_attr)
-                else:
-                    if(language != "ko"):
-                        line = line.capitalize()
-                    yield line
+    return get_normalizer(channel, language).process(captions)
 
 
 def process_captions_ja(captions):
-    for line in captions:
-        if line and not re.search("^[0-9]([0-9:,\-\ >])*\n", line):
-                line = line.strip()
-                # Remove emoji
-                line = remove_emoji(line)
-
-                # Replace all punctuation except commas
-                line = re.sub("[！‼？!?.…]", "。", line)
-                line = line.replace("～", "") # Re doesn't recognize ～
-                line = line.replace("〜", "") # These are two different chars, believe it or not.
-                line = line.replace("、、、", "。") # Special case of ellipses
-
-                # Reomove text within matched parentheticals
-                parentheses = ["（[^（）]*）", "〔[^〔〕]*〕", "\([^()]*\)", "\[[^\[\]]*\]", "【[^【】)]*】", "＜[^＜＞)]*＞", "｛[｛｝)]*｝"]
-                for paren_type in parentheses:
-                    line = re.sub(paren_type, "", line)
-
-                # Remove HTML
-                line = re.sub(r'<[^)]*>', '', line)
-
-                if not line:
-                    #print("Final:   NA")
-                    #input()
-                    continue
-
-                # Hacky fix for some troublesome whitespace typos
-                attr_typos = [(" ：", "："), (" ）","）"), (" )", ")")]
-                for typo, correction in attr_typos:
-                    line = line.replace(typo, correction)
-
-                # Remove speaker attributions (NOTE: Depends on above fix)
-                line_noattr = re.sub("[^\s　。、]+[）\):：;)≫>]", "。", line)
-
-                # Hacky solution for attributions using 「」
-                # Do best to prevent accidentally removing content outside 「」or
-                # when the 「」 isn't actually an attibution
-                if(line_noattr == line):
-                    if line[-1] == "」" or (line.find("「") > -1 and line.find("」") == -1):
-                        line = re.sub("^[^\s]+「", "。", line).replace("」", "")
-                else:
-                    line = line_noattr
-
-                # Remove action text
-                line = re.sub("[（\(](.*)", "", line)
-
-                # Remove any stray special characters
-                line = re.sub("[●<>・･‥／☆\s♫♡♥♪♪→↑↖↓←”✖wｗWｗＷ※⇓⇒()（）【】《》✖「」『』〈〉]*", "", line)
-
-                # Fixes for multiple & initial periods
-                line = re.sub("。+", "。", line)
-                line = re.sub("^。", "", line)
-
-                if line:
-                    if(line[-1] != '。' and line[-1] != '、'):
-                        line += '。'
-                    yield line
-                else:
-                    continue
+    return get_normalizer(None, 'ja').process(captions)
 
 
 if __name__ == '__main__':
@@ -195,8 +355,10 @@ if __name__ == '__main__':
     parser.add_argument('language', type=str, help='language code')
     parser.add_argument('--group', '-g', default=None, type=str, help='grouping folder')
 
-    parser.add_argument('-s', '--start', default=0, type=int, help='video to start from')
-    parser.add_argument('-e', '--end', default=-1, type=int, help='video to stop at')
+    parser.add_argument('-s', '--start', default=0, type=int, help='index of the video to start from (in file name order)')
+    parser.add_argument('-e', '--end', default=-1, type=int, help='index of the video to stop at (inclusive)')
+    parser.add_argument('--keep_rolling', action='store_true', default=False, help='keep the repeated lines of rolling auto-captions instead of keeping each spoken word once (word timings are then not saved)')
+    parser.add_argument('-w', '--workers', default=1, type=int, help='number of worker processes to clean files in parallel')
 
     parser.add_argument('--log', action='store_true', default=False, help='log events to file')
 
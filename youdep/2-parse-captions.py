@@ -2,78 +2,1203 @@
 
 # Parse caption data using Stanza to produce sentence-by-sentence dependency parses.
 
-import stanza, json, argparse, logging
+import stanza, torch, json, argparse, logging, re, sys, time, sqlite3, hashlib, gzip, io, gc
+from collections import OrderedDict, deque
+from csv import DictWriter
+from stanza.utils.conll import CoNLL
+from multiprocessing import Process, Queue, Pipe, cpu_count
+from multiprocessing.connection import wait
 from sys import argv
 from glob import glob
-from os import path, makedirs, getcwd
+from os import path, makedirs, getcwd, replace, stat, sep, remove, getpid
 from sys import stdout
 
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "..", "base"))
+import Captions
+import ParserService
+
+# Unix only: without it (on Windows), --memory_limit is unavailable and pipeline sizes are not measured
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Windows are only closed after a line ending in one of these
+SENTENCE_FINAL = ".!?。！？"
+
+# Words batched together by Stanza's tagger and parser by default
+STANZA_BATCH_SIZE = 5000
+
+# Stanza processors run by each profile (shared with the parser service)
+PROCESSOR_PROFILES = ParserService.PROCESSOR_PROFILES
+
 
 def main(args):
+
+    if args.all:
+        channels = find_channels(args)
+        if(len(channels) == 0):
+            print("ERROR: No SRT files found under corpus/processed_subtitles.")
+            return
+        print("Found {0} channels in {1} languages".format(len(channels), len(set(channel_args.language for channel_args in channels))))
+    else:
+        if(len(get_videos(args)) == 0):
+            print("ERROR: No SRT files found. Did you spell the channel name correctly?")
+            return
+        channels = [args]
+
+    tasks = get_tasks(channels)
+
+    if args.stream:
+        # Followers check that the stream and its end marker are from this run
+        run_id = "{0}-{1}".format(time.strftime("%Y%m%dT%H%M%S"), getpid())
+        for channel_args in channels:
+            start_stream(channel_args, get_dep_path(channel_args), run_id)
+
+    # Parse in supervised worker processes when the watchdog is on
+    try:
+        if args.workers > 1 or args.timeout or args.memory_limit:
+            parse_files_parallel(args, tasks)
+        else:
+            parse_files(args, tasks)
+    finally:
+        # Let readers following the streams know that no more sentences are coming
+        if args.stream:
+            for channel_args in channels:
+                end_stream(channel_args, get_dep_path(channel_args), run_id)
+
+
+def find_channels(args):
+    """Find every caption type, language, and channel folder of SRT files under processed_subtitles, ordered by
+    language so that each language's files are parsed one after the other.
+
+    :return channels: List of copies of ARGS, one per channel, with its caption type, language, and channel
+    """
+
+    channels = []
+    for channel_dir in glob(path.join("corpus", "processed_subtitles", "*", "*", "*", "")):
+        caption_type, language, channel = path.normpath(channel_dir).split(sep)[-3:]
+
+        channel_args = argparse.Namespace(**vars(args))
+        channel_args.caption_type, channel_args.language, channel_args.channel = caption_type, language, channel
+        if get_videos(channel_args):
+            channels.append(channel_args)
+
+    return sorted(channels, key=lambda channel_args: (channel_args.language, channel_args.caption_type, channel_args.channel))
+
+
+def get_videos(args):
+    """List a channel's subtitles files.
+
+    :return videos: List of (video id, subtitles file name) tuples
+    """
+
     subtitles_fns = sorted(glob(path.join("corpus", "processed_subtitles", args.caption_type, args.language, args.channel, "*.srt")))
-    if(len(subtitles_fns) == 0):
-        print("ERROR: No SRT files found. Did you spell the channel name correctly?")
-        return
 
-    nlp = stanza.Pipeline(lang=args.language, use_gpu=True)
-    parse_files(nlp, args.channel, args.language, args.caption_type, args.start, args.end, subtitles_fns)
+    # Videos are numbered by their position among all the channel's files, so that numbers (and output names)
+    # do not depend on --start, --end, or --skip_duplicates
+    videos = list(enumerate(subtitles_fns))
+
+    # Drop videos flagged as near-duplicates in the group log ($channel_$yt_id_processed.txt.srt)
+    if args.skip_duplicates:
+        duplicates = Captions.read_duplicates(args.skip_duplicates)
+        videos = [(video_id, fn) for video_id, fn in videos if path.basename(fn).split("_processed")[0].rsplit("_", 1)[-1] not in duplicates]
+
+    return videos
+
+
+def get_tasks(channels):
+    """Collect the jobs of every channel, in channel order.
+
+    :return tasks: List of (channel arguments, dependencies folder, job) tuples
+    """
+
+    tasks = []
+    for channel_args in channels:
+        dep_path = get_dep_path(channel_args)
+        tasks += [(channel_args, dep_path, job) for job in get_jobs(channel_args, get_videos(channel_args), dep_path)]
+
+    return tasks
+
+
+def get_processors(args):
+    """List the processors of the selected profile, leaving out the multi-word token expander for languages
+    that have none. With --service, the service resolves them against its own models.
+    """
+
+    processors = PROCESSOR_PROFILES[args.profile]
+    if args.service:
+        return processors
+
+    return ParserService.get_processors(args.language, processors)
+
+
+def get_pipeline_options(args):
+    options = {}
+    processors = get_processors(args)
+    if processors:
+        options.update({"processors": processors})
+    if uses_pretokenized(args, args.language):
+        # Each caption line is a sentence, split into tokens by get_document
+        options.update({"tokenize_pretokenized": True})
+    if args.batch_tokens > STANZA_BATCH_SIZE:
+        # Let the tagger and parser batch as many words as are sent at once (never fewer than by default)
+        options.update({"pos_batch_size": args.batch_tokens, "depparse_batch_size": args.batch_tokens})
+    return options
+
+
+def uses_pretokenized(args, language):
+    return args.pretokenized and language not in Captions.UNSPACED_LANGUAGES
+
+
+def get_document(args, text):
+    """Prepare a transcript (or a window of one) for the pipeline: its text, or with -p, its tokens, as a list of
+    tokens per caption line.
+    """
 
+    if uses_pretokenized(args, args.language):
+        # An empty transcript stays a text, since Stanza would take an empty list for an empty batch
+        return Captions.tokenize_lines(text) or text
+    return text
 
-def parse_files(nlp, channel, language, type, start, end, subtitles_fns):
 
-    dep_path = path.join("corpus", "dependency_corpus", type, language, channel)
+def get_documents(args, texts):
+    """Prepare transcripts (or windows) to be parsed together in one call. Stanza takes these as Documents, so with
+    -p, each document's tokens are joined by spaces, one caption line per line, which Stanza splits into the same
+    sentences and tokens as the lists of get_document.
+    """
+
+    if uses_pretokenized(args, args.language):
+        texts = ["\n".join(" ".join(tokens) for tokens in Captions.tokenize_lines(text)) for text in texts]
+    return [stanza.Document([], text=text) for text in texts]
+
+
+def load_pipeline(args, use_gpu=True):
+    if args.service:
+        # Pipelines stay loaded in the parser service (see ParserService.py)
+        nlp = ParserService.RemotePipeline(args.service, args.language, get_pipeline_options(args))
+    else:
+        nlp = stanza.Pipeline(lang=args.language, use_gpu=use_gpu, **get_pipeline_options(args))
+
+    if args.cache:
+        pretokenized = uses_pretokenized(args, args.language)
+        cache = ParseCache(args.cache, args.cache_size, "sentences" if pretokenized else "documents")
+        return CachedPipeline(nlp, cache, args.language, get_model_version(nlp, args), pretokenized)
+    return nlp
+
+
+def get_memory_mb(use_gpu):
+    """Memory allocated by torch on the GPU, or else the resident memory of this process, in MB (0 where it cannot
+    be measured, as on Windows).
+    """
+
+    if use_gpu and torch.cuda.is_available():
+        return torch.cuda.memory_allocated() / (1024 * 1024)
+
+    if resource is None:
+        return 0
+
+    try:
+        with open("/proc/self/statm", "r") as statm_in:
+            return int(statm_in.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        # Without /proc (e.g., on macOS), fall back on peak memory, in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024)
+
+
+class PipelinePool:
+    """Keep pipelines for several languages loaded, within a memory budget, evicting the least recently used
+    pipeline to make room for a new one. Each pipeline's size is measured as it is loaded.
+    """
+
+    def __init__(self, budget_mb, use_gpu=True):
+
+        self.budget_mb = budget_mb
+        self.use_gpu   = use_gpu
+        self.pipelines = OrderedDict()
+        self.num_loads = 0
+
+    def get(self, args):
+
+        if args.language in self.pipelines:
+            self.pipelines.move_to_end(args.language)
+            return self.pipelines[args.language][0]
+
+        # Make room for a pipeline as large as the largest one loaded so far
+        expected_mb = max([size_mb for nlp, size_mb in self.pipelines.values()], default=0)
+        while self.pipelines and sum(size_mb for nlp, size_mb in self.pipelines.values()) + expected_mb > self.budget_mb:
+            self.evict()
+
+        if args.pretokenized and not uses_pretokenized(args, args.language):
+            print("{0} is written without spaces; tokenizing it with Stanza".format(args.language))
+
+        memory_mb = get_memory_mb(self.use_gpu)
+        nlp = load_pipeline(args, self.use_gpu)
+        size_mb = max(0, get_memory_mb(self.use_gpu) - memory_mb)
+
+        self.pipelines[args.language] = (nlp, size_mb)
+        self.num_loads += 1
+        logging.info("Loaded {0} pipeline ({1:.0f} MB)".format(args.language, size_mb))
+
+        return nlp
+
+    def evict(self):
+
+        language, (nlp, size_mb) = self.pipelines.popitem(last=False)
+        logging.info("Unloading {0} pipeline ({1:.0f} MB)".format(language, size_mb))
+
+        if isinstance(nlp, CachedPipeline):
+            nlp.cache.close()
+        del nlp
+
+        gc.collect()
+        if self.use_gpu and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def close(self):
+        while self.pipelines:
+            self.evict()
+
+
+def get_dep_path(args):
+
+    dep_path = path.join("corpus", "dependency_corpus", args.caption_type, args.language, args.channel)
     if not path.exists(dep_path):
         makedirs(dep_path)
 
-    video_count = 0
-    for subtitles_fn in subtitles_fns:
-        if video_count < start:
+    return dep_path
+
+
+def get_jobs(args, videos, dep_path):
+    """Select the videos from START to END (inclusive) that still need parsing, and group them into jobs.
+
+    :param videos: List of (video id, subtitles file name) tuples
+    :return jobs: List of jobs, each a list of (subtitles file name, video id) tuples; jobs hold one file each,
+                  or several files of about BATCH_TOKENS tokens in total
+    """
+
+    # Windowed files are batched window by window instead
+    batch_tokens = 0 if args.window_chars else args.batch_tokens
+
+    jobs, batch, batch_size = [], [], 0
+    num_complete = 0
+    for video_id, subtitles_fn in videos:
+        if video_id < args.start or (args.end != -1 and video_id > args.end):
             continue
-        if end != -1 and video_count > end:
+
+        if not args.overwrite and is_complete(args, dep_path, video_id, subtitles_fn):
+            num_complete += 1
+            continue
+
+        if batch_tokens:
+            batch.append((subtitles_fn, video_id))
+            batch_size += count_tokens(read_subtitles(subtitles_fn), args.language)
+            if batch_size >= batch_tokens:
+                jobs.append(batch)
+                batch, batch_size = [], 0
+        else:
+            jobs.append([(subtitles_fn, video_id)])
+
+    if batch:
+        jobs.append(batch)
+
+    if num_complete:
+        print("{0}: skipping {1} videos that are already parsed (use -o to parse them again)".format(args.channel, num_complete))
+        if args.stream:
+            print("{0}: the {1} skipped videos will not be in the stream".format(args.channel, num_complete))
+
+    return jobs
+
+
+def hash_file(fp):
+
+    digest = hashlib.sha1()
+    with open(fp, 'rb') as file_in:
+        for block in iter(lambda: file_in.read(1 << 16), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def get_marker_fn(args, dep_path, video_id):
+    return path.join(dep_path, "{0}_{1}_dependencies.{2}.done".format(args.channel, video_id, args.format))
+
+
+def write_marker(args, dep_path, video_id, subtitles_fn, output_fn, num_sentences, member=None):
+    """Record that a video's parse is complete, with the subtitles file it was parsed from and the size of the output
+    (or, in a shard, the offset, size, and SHA-1 of the video's gzip member). The marker is only written once the
+    output is, so an interrupted parse leaves no marker.
+    """
+
+    subtitles_stat = stat(subtitles_fn)
+    marker = {"source": path.basename(subtitles_fn),
+              "sha1": hash_file(subtitles_fn),
+              "size": subtitles_stat.st_size,
+              "mtime_ns": subtitles_stat.st_mtime_ns,
+              "format": args.format,
+              "profile": args.profile,
+              "output": path.basename(output_fn),
+              "output_size": path.getsize(output_fn),
+              "shard": bool(args.shard and args.format == "conllu"),
+              "member": member,
+              "sentences": num_sentences}
+
+    marker_fn = get_marker_fn(args, dep_path, video_id)
+    with open(marker_fn + ".tmp", "w") as marker_out:
+        json.dump(marker, marker_out)
+    replace(marker_fn + ".tmp", marker_fn)
+
+
+def is_complete(args, dep_path, video_id, subtitles_fn):
+    """Check whether a video already has a complete parse: a completion marker for the same subtitles file (unchanged
+    since, by size and modification time or else by SHA-1) in the current output format, layout, and processor profile,
+    whose output is still there in full.
+    """
+
+    marker_fn = get_marker_fn(args, dep_path, video_id)
+    if not path.isfile(marker_fn):
+        return False
+
+    try:
+        with open(marker_fn, "r") as marker_in:
+            marker = json.load(marker_in)
+    except json.decoder.JSONDecodeError:
+        return False
+
+    if marker["source"] != path.basename(subtitles_fn) or marker["format"] != args.format or marker.get("profile") != args.profile:
+        return False
+    if marker["shard"] != bool(args.shard and args.format == "conllu"):
+        return False
+
+    output_fn = path.join(dep_path, marker["output"])
+    if not path.isfile(output_fn):
+        return False
+    if marker["shard"]:
+        # Shards keep growing after a video is appended, so check the video's own member
+        if not marker.get("member") or not has_member(output_fn, *marker["member"]):
+            return False
+    elif path.getsize(output_fn) != marker["output_size"]:
+        return False
+
+    subtitles_stat = stat(subtitles_fn)
+    if subtitles_stat.st_size != marker["size"]:
+        return False
+
+    return subtitles_stat.st_mtime_ns == marker["mtime_ns"] or hash_file(subtitles_fn) == marker["sha1"]
+
+
+def has_member(shard_fn, offset, size, sha1):
+    """Check that a shard still holds a gzip member of SIZE bytes with the given SHA-1 at OFFSET.
+    """
+
+    with open(shard_fn, 'rb') as shard_in:
+        shard_in.seek(offset)
+        member = shard_in.read(size)
+
+    return len(member) == size and hashlib.sha1(member).hexdigest() == sha1
+
+
+def parse_job(nlp, job, args, dep_path):
+    """Parse one job from get_jobs.
+
+    :return counts: List of (number of sentences, number of tokens) per file, with None for files that could not be parsed
+    """
+
+    if len(job) > 1:
+        return parse_batch(nlp, job, args, dep_path)
+
+    subtitles_fn, video_id = job[0]
+    logging.info("Processing {1}: {0}".format(subtitles_fn, video_id))
+
+    if args.window_chars:
+        return [parse_file_windowed(nlp, subtitles_fn, args, video_id, dep_path)]
+
+    return [count_parse(parse_file(nlp, subtitles_fn, args, video_id, dep_path))]
+
+
+def add_stats(stats, key, counts, seconds):
+    """Add a job's files, sentences, tokens, and parsing time to the totals for its language (or worker).
+    """
+
+    key_stats = stats.setdefault(key, [0, 0, 0, 0.0])
+    key_stats[0] += len(counts)
+    key_stats[1] += sum(file_counts[0] for file_counts in counts if file_counts)
+    key_stats[2] += sum(file_counts[1] for file_counts in counts if file_counts)
+    key_stats[3] += seconds
+
+
+def print_stats(stats, args):
+
+    for language, (num_files, num_sentences, num_tokens, seconds) in sorted(stats.items()):
+        print("{0} ({1}): {2} files, {3} sentences, {4} tokens in {5:.1f}s{6} ({7:.1f} tokens/s)".format(
+            language, "pretokenized" if uses_pretokenized(args, language) else "tokenized", num_files, num_sentences, num_tokens,
+            seconds, " of worker time" if args.workers > 1 else "", num_tokens / max(seconds, 1e-9)))
+
+
+def get_report_rows(channel_args, job, counts, seconds, status=None):
+    """Describe how each file of a job went, for the run's report.
+
+    :param status: "timeout" or "crashed" if the job was stopped; otherwise, "parsed" or "error" from its counts
+    """
+
+    rows = []
+    for (subtitles_fn, video_id), file_counts in zip(job, counts):
+        rows.append({"caption_type": channel_args.caption_type, "language": channel_args.language, "channel": channel_args.channel,
+                     "video_id": video_id, "subtitles": path.basename(subtitles_fn),
+                     "status": status or ("parsed" if file_counts else "error"), "seconds": round(seconds / len(job), 3),
+                     "sentences": file_counts[0] if file_counts else 0, "tokens": file_counts[1] if file_counts else 0})
+
+    return rows
+
+
+def write_report(report, args):
+
+    report_dir = path.dirname(args.report)
+    if report_dir and not path.exists(report_dir):
+        makedirs(report_dir)
+
+    with open(args.report, "w", newline="") as report_out:
+        writer = DictWriter(report_out, fieldnames=["caption_type", "language", "channel", "video_id", "subtitles", "status", "seconds", "sentences", "tokens"])
+        writer.writeheader()
+        writer.writerows(report)
+
+    failed = [row["status"] for row in report if row["status"] != "parsed"]
+    print("Parsed {0} of {1} files; {2} timed out, {3} crashed, {4} could not be parsed (report: {5})".format(
+        len(report) - len(failed), len(report), failed.count("timeout"), failed.count("crashed"), failed.count("error"), args.report))
+
+
+def parse_files(args, tasks):
+
+    pool = PipelinePool(args.memory_budget, use_gpu=True)
+
+    stats, report = {}, []
+    for channel_args, dep_path, job in tasks:
+        # Let go of the last pipeline first, so that the pool can free it before loading another
+        nlp = None
+        nlp = pool.get(channel_args)
+        start_time = time.time()
+        counts = parse_job(nlp, job, channel_args, dep_path)
+        add_stats(stats, channel_args.language, counts, time.time() - start_time)
+        report += get_report_rows(channel_args, job, counts, time.time() - start_time)
+
+    pool.close()
+
+    print_stats(stats, args)
+    if args.all:
+        print("Loaded {0} pipelines".format(pool.num_loads))
+    write_report(report, args)
+
+
+def parse_worker(worker_id, args, threads, use_gpu, task_queue, results_out):
+    """Parse the tasks sent to this worker, one at a time, with its own number of torch threads and pool of
+    pipelines, and within the memory ceiling if one is set. The worker reports when it starts parsing each task
+    (after loading any pipeline it needs), so that the watchdog only times the parse. A MemoryError ends the worker,
+    which the watchdog records as a crash.
+    """
+
+    if args.memory_limit:
+        # Limit the address space, so that runaway allocations fail or end the worker instead of the machine
+        # (enforced on Linux; macOS accepts the limit but ignores it)
+        limit = args.memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    torch.set_num_threads(threads)
+    pool = PipelinePool(args.memory_budget, use_gpu)
+
+    while True:
+        message = task_queue.get()
+        if message is None:
             break
 
-        logging.info("Processing {1}: {0}".format(subtitles_fn, video_count))
-        parse_file(nlp, subtitles_fn, channel, video_count, dep_path)
-        video_count += 1
+        task_id, (channel_args, dep_path, job) = message
+        # Let go of the last pipeline first, so that the pool can free it before loading another
+        nlp = None
+        nlp = pool.get(channel_args)
+
+        results_out.send(("start", worker_id, task_id))
+        start_time = time.time()
+        counts = parse_job(nlp, job, channel_args, dep_path)
+        results_out.send(("done", worker_id, task_id, counts, time.time() - start_time))
+
+    pool.close()
+
+    results_out.send(("exit", worker_id, None, pool.num_loads))
+
+
+def start_worker(worker_id, args, threads, use_gpu):
+
+    # Each worker reports on its own pipe, so that stopping a worker partway through a message cannot block or
+    # garble the messages of the others
+    task_queue = Queue()
+    results_in, results_out = Pipe(duplex=False)
+    process = Process(target=parse_worker, args=(worker_id, args, threads, use_gpu, task_queue, results_out))
+    process.start()
+
+    # Only the worker writes to the pipe, so that reading it fails once the worker is gone
+    results_out.close()
+
+    return {"process": process, "queue": task_queue, "results": results_in, "task_id": None, "task": None, "start_time": None}
+
+
+def receive_messages(worker):
+    """Read the messages waiting on a worker's pipe, until it is empty or closed (once the worker has died).
+    """
+
+    messages = []
+    try:
+        while worker["results"].poll():
+            messages.append(worker["results"].recv())
+    except (EOFError, OSError):
+        pass
+
+    return messages
+
+
+def parse_files_parallel(args, tasks):
+    """Parse files in WORKERS processes, each with THREADS torch threads (by default, the CPU cores divided
+    evenly between workers), handing each idle worker the next task. Tasks are in language order, so that
+    workers move through the languages together and rarely need to swap pipelines.
+
+    A watchdog stops a worker whose task runs longer than TIMEOUT seconds, or which dies (e.g., on reaching
+    MEMORY_LIMIT), and starts a new one in its place. The files of a stopped batch are parsed again one at a time,
+    so that only the file at fault is recorded as failed.
+    """
+
+    workers = args.workers
+    threads = args.threads or max(1, cpu_count() // workers)
 
-def parse_file(nlp, subtitles_fn, channel, video_id, dep_path):
+    # A single supervised worker can use the GPU (unless its address space is limited)
+    use_gpu = workers == 1 and not args.memory_limit
 
-    dependencies_fn = path.join(dep_path, "{0}_{1}_dependencies.json".format(channel, video_id))
+    pool_workers = [start_worker(i, args, threads, use_gpu) for i in range(workers)]
 
-    with open(subtitles_fn, "r") as subtitles_in, open(dependencies_fn, "w") as dependencies_out:
+    pending = deque(tasks)
+    stats, worker_stats, report = {}, {}, []
+    num_loads, num_restarts, task_id = 0, 0, 0
+    start_time = time.time()
+
+    while pending or any(worker["task"] for worker in pool_workers):
+
+        for worker in pool_workers:
+            if worker["task"] is None and pending:
+                task_id += 1
+                worker["task_id"], worker["task"], worker["start_time"] = task_id, pending.popleft(), None
+                worker["queue"].put((task_id, worker["task"]))
+
+        wait([worker["results"] for worker in pool_workers], timeout=0.5)
+
+        for worker in pool_workers:
+            for message in receive_messages(worker):
+                if message[0] == "start":
+                    worker["start_time"] = time.time()
+                elif message[0] == "done":
+                    counts, seconds = message[3], message[4]
+                    channel_args, dep_path, job = worker["task"]
+                    add_stats(stats, channel_args.language, counts, seconds)
+                    add_stats(worker_stats, message[1], counts, seconds)
+                    report += get_report_rows(channel_args, job, counts, seconds)
+                    worker["task_id"], worker["task"] = None, None
+
+        for worker_id, worker in enumerate(pool_workers):
+            timed_out = worker["task"] and args.timeout and worker["start_time"] and time.time() - worker["start_time"] > args.timeout
+            if not timed_out and worker["process"].is_alive():
+                continue
+
+            # The worker's pipe is dropped with it, so the other workers' messages are unaffected
+            status = "timeout" if timed_out else "crashed"
+            worker["process"].kill()
+            worker["process"].join()
+            worker["results"].close()
+            pool_workers[worker_id] = start_worker(worker_id, args, threads, use_gpu)
+
+            # A worker that died between tasks has nothing to report
+            if worker["task"] is None:
+                logging.warning("Worker {0} exited between tasks; restarted it".format(worker_id))
+                continue
+            num_restarts += 1
+
+            channel_args, dep_path, job = worker["task"]
+            if len(job) > 1:
+                logging.warning("Worker {0} stopped ({1}) on a batch of {2} files; parsing them one at a time".format(worker_id, status, len(job)))
+                pending.extendleft(reversed([(channel_args, dep_path, [video]) for video in job]))
+            else:
+                subtitles_fn, video_id = job[0]
+                seconds = time.time() - worker["start_time"] if worker["start_time"] else 0
+                print("{0}: could not parse {1} ({2} after {3:.0f}s)".format(channel_args.channel, path.basename(subtitles_fn), status, seconds))
+                logging.warning("Could not parse {0}: {1}".format(video_id, status))
+                add_stats(stats, channel_args.language, [None], seconds)
+                report += get_report_rows(channel_args, job, [None], seconds, status)
+
+    for worker in pool_workers:
+        worker["queue"].put(None)
+
+    for worker_id, worker in enumerate(pool_workers):
+        # Reading fails, instead of waiting forever, if the worker died without reporting
+        try:
+            message = worker["results"].recv()
+            num_loads += message[3]
+        except (EOFError, OSError):
+            logging.warning("Worker {0} exited without reporting".format(worker_id))
+
+        worker["process"].join()
+        worker["results"].close()
+
+    print("Parsed with {0} workers x {1} threads{2}".format(workers, threads, ", {0} restarted".format(num_restarts) if num_restarts else ""))
+    for worker_id, (num_files, num_sentences, num_tokens, seconds) in sorted(worker_stats.items()):
+        print("Worker {0}: {1} files, {2} sentences, {3} tokens in {4:.1f}s ({5:.1f} sentences/s, {6:.1f} tokens/s)".format(
+            worker_id, num_files, num_sentences, num_tokens, seconds, num_sentences / max(seconds, 1e-9), num_tokens / max(seconds, 1e-9)))
+
+    total_sentences = sum(worker_totals[1] for worker_totals in worker_stats.values())
+    print("Total: {0} sentences ({1:.1f} sentences/s), {2} pipelines loaded".format(total_sentences, total_sentences / max(time.time() - start_time, 1e-9), num_loads))
+
+    print_stats(stats, args)
+    write_report(report, args)
+
+
+def count_tokens(text, language):
+    if language in Captions.UNSPACED_LANGUAGES:
+        return len(text)
+    return len(text.split())
+
+
+def count_parse(parse):
+    if parse is None:
+        return None
+    return (len(parse), sum(len(sentence) for sentence in parse))
+
+
+def read_subtitles(subtitles_fn):
+    with open(subtitles_fn, "r") as subtitles_in:
+        return "".join(subtitles_in)
+
+
+def get_stream_fn(args, dep_path):
+    return path.join(dep_path, "{0}_dependencies.stream.{1}".format(args.channel, args.stream))
+
+
+def start_stream(args, dep_path, run_id):
+    """Empty the channel's stream for a new run, starting it with a header naming the run and its processor profile:
+    a JSON object in JSONL streams (whose documents are lists), or comments in CoNLL-U streams.
+    """
+
+    stream_fn = get_stream_fn(args, dep_path)
+    with open(stream_fn, "w") as stream_out:
+        if args.stream == "jsonl":
+            stream_out.write(json.dumps({"run": run_id, "profile": args.profile}) + "\n")
+        else:
+            stream_out.write("# run = {0}\n# profile = {1}\n".format(run_id, args.profile))
+    if path.exists(stream_fn + ".end"):
+        remove(stream_fn + ".end")
+
+
+def end_stream(args, dep_path, run_id):
+    with open(get_stream_fn(args, dep_path) + ".end", "w") as end_out:
+        end_out.write(run_id)
+
+
+def format_conllu(sentence, sent_id):
+
+    lines = ["# sent_id = {0}".format(sent_id)]
+    lines += ["\t".join(token) for token in CoNLL.convert_dict([sentence])[0]]
+
+    return "\n".join(lines) + "\n\n"
+
+
+class DependencyWriter:
+    """Write one video's parsed sentences: as a JSON list of Stanza sentences (the default), or as gzip-compressed
+    CoNLL-U, to the video's own file or appended to the channel's shard. Shards hold one gzip member per video,
+    appended in a single write once the video is done, so that workers can share them. A video parsed again is
+    appended again; 3-process-dependencies.py reads only its last member.
+
+    With --stream, the video's sentences are also appended to the channel's stream (as one JSON document per line,
+    or as CoNLL-U), for 3-process-dependencies.py --follow to read while parsing goes on. They are kept until the
+    video is done, then appended in a single write, so that a video that fails partway (or whose worker is stopped)
+    leaves nothing in the stream.
+    """
+
+    def __init__(self, args, dep_path, video_id, subtitles_fn):
+
+        self.args = args
+        self.dep_path = dep_path
+        self.video_id = video_id
+        self.subtitles_fn = subtitles_fn
+
+        self.format = args.format
+        self.doc_id = "{0}_{1}".format(args.channel, video_id)
+        self.num_sentences = 0
+        self.shard_fn = None
+        self.stream_blocks = [] if args.stream else None
+
+        if self.format == "json":
+            self.output_fn = path.join(dep_path, "{0}_dependencies.json".format(self.doc_id))
+            self.out = open(self.output_fn, "w")
+            self.out.write("[")
+        else:
+            if args.shard:
+                self.output_fn = self.shard_fn = path.join(dep_path, "{0}_dependencies.shard.conllu.gz".format(args.channel))
+                self.buffer = io.BytesIO()
+                self.out = io.TextIOWrapper(gzip.GzipFile(fileobj=self.buffer, mode="wb"), encoding="utf-8")
+            else:
+                self.output_fn = path.join(dep_path, "{0}_dependencies.conllu.gz".format(self.doc_id))
+                self.out = gzip.open(self.output_fn, "wt", encoding="utf-8")
+            self.out.write("# newdoc id = {0}\n".format(self.doc_id))
+            self.out.write("# profile = {0}\n".format(args.profile))
+
+    def write(self, sentence):
+
+        sent_id = "{0}_{1}".format(self.doc_id, self.num_sentences)
+
+        if self.format == "json":
+            self.out.write(", " if self.num_sentences else "")
+            json.dump(sentence, self.out)
+        else:
+            self.out.write(format_conllu(sentence, sent_id))
+
+        if self.stream_blocks is not None:
+            self.stream_blocks.append(json.dumps(sentence) if self.args.stream == "jsonl" else format_conllu(sentence, sent_id))
+
+        self.num_sentences += 1
+
+    def close(self):
+
+        if self.format == "json":
+            self.out.write("]")
+        self.out.close()
+
+        member = None
+        if self.shard_fn:
+            data = self.buffer.getvalue()
+            # Unbuffered, so that the file position is where this write ended, whatever other workers appended before
+            with open(self.shard_fn, "ab", buffering=0) as shard_out:
+                shard_out.write(data)
+                member = [shard_out.tell() - len(data), len(data), hashlib.sha1(data).hexdigest()]
+
+        write_marker(self.args, self.dep_path, self.video_id, self.subtitles_fn, self.output_fn, self.num_sentences, member)
+
+        if self.stream_blocks:
+            if self.args.stream == "jsonl":
+                # The video is one document, as in JSONL files
+                data = "[" + ", ".join(self.stream_blocks) + "]\n"
+            else:
+                data = "".join(self.stream_blocks)
+            # Unbuffered, so that the video is appended in a single write, whole, between other workers' videos
+            with open(get_stream_fn(self.args, self.dep_path), "ab", buffering=0) as stream_out:
+                stream_out.write(data.encode("utf-8"))
+
+    def abort(self):
+        """Stop writing a video that could not be parsed in full, leaving no marker (or shard member) behind, so that
+        the next run parses it again. Its sentences are not streamed.
+        """
+
+        self.out.close()
+
+        if not self.shard_fn and path.exists(self.output_fn):
+            remove(self.output_fn)
+
+
+def write_dependencies(parse, args, dep_path, video_id, subtitles_fn):
+    writer = DependencyWriter(args, dep_path, video_id, subtitles_fn)
+    for sentence in parse:
+        writer.write(sentence)
+    writer.close()
+
+
+def parse_batch(nlp, batch, args, dep_path):
+    """Parse several files' transcripts in one call to the pipeline, so that Stanza can batch sentences across
+    documents, then write each document to its own dependencies file.
+
+    :param batch: List of (subtitles file name, video id) tuples
+    :return counts: List of (number of sentences, number of tokens) per file
+    """
+
+    logging.info("Parsing batch of {0} files: {1} to {2}".format(len(batch), batch[0][1], batch[-1][1]))
+
+    try:
+        nlp_docs = nlp(get_documents(args, [read_subtitles(subtitles_fn) for subtitles_fn, video_id in batch]))
+    except MemoryError:
+        raise
+    except Exception as e:
+        # Fall back to one file at a time, so that one bad file does not lose the whole batch
+        logging.warning("Could not parse batch ({0}); parsing files one at a time".format(type(e).__name__))
+        return [count_parse(parse_file(nlp, subtitles_fn, args, video_id, dep_path)) for subtitles_fn, video_id in batch]
+
+    counts = []
+    for (subtitles_fn, video_id), nlp_doc in zip(batch, nlp_docs):
+        parse = nlp_doc.to_dict()
+        write_dependencies(parse, args, dep_path, video_id, subtitles_fn)
+        counts.append(count_parse(parse))
+
+    return counts
+
+
+def parse_file(nlp, subtitles_fn, args, video_id, dep_path):
+
+    with open(subtitles_fn, "r") as subtitles_in:
 
         preprocessed_subtitles = list(subtitles_in)
         logging.info("Found {0} lines".format(len(preprocessed_subtitles)))
 
         nlp_subtitles = None
         try:
-            nlp_subtitles = nlp("".join(preprocessed_subtitles))
-            dependencies_json = json.dump(nlp_subtitles.to_dict(), dependencies_out)
+            nlp_subtitles = nlp(get_document(args, "".join(preprocessed_subtitles))).to_dict()
+            write_dependencies(nlp_subtitles, args, dep_path, video_id, subtitles_fn)
         except RecursionError as e:
             logging.warning("Could not parse {0}: recursion depth exceeded".format(video_id))
+        except MemoryError:
+            # Let the watchdog of parse_files_parallel end the worker and record a crash
+            raise
         except:
             logging.warning("Could not parse {0}: an unexpected error occurred".format(video_id))
 
-    return
+    return nlp_subtitles
+
+
+def iter_windows(subtitles_in, window_chars):
+    """Split a transcript into windows of about WINDOW_CHARS characters, closing each window after a line that
+    ends a sentence (or, failing that, once it reaches twice the size).
+
+    :param subtitles_in: An iterable of lines
+    :return windows: Generator of (character offset, text) tuples
+    """
+
+    window, size, offset = [], 0, 0
+    for line in subtitles_in:
+        window.append(line)
+        size += len(line)
+        if size >= window_chars and (line.rstrip()[-1:] in SENTENCE_FINAL or size >= 2 * window_chars):
+            yield (offset, "".join(window))
+            window, offset, size = [], offset + size, 0
+
+    if window:
+        yield (offset, "".join(window))
+
+
+def shift_offsets(sentence, offset):
+    """Move a window's character offsets to their position in the whole transcript.
+    """
+
+    for token in sentence:
+        if "start_char" in token:
+            token["start_char"] += offset
+            token["end_char"] += offset
+        # Older versions of Stanza keep offsets in the misc field
+        if "start_char=" in token.get("misc", ""):
+            token["misc"] = re.sub(r"(start_char|end_char)=(\d+)", lambda match: "{0}={1}".format(match.group(1), int(match.group(2)) + offset), token["misc"])
+
+    return sentence
+
 
+def parse_file_windowed(nlp, subtitles_fn, args, video_id, dep_path):
+    """Parse a transcript window by window, writing each window's sentences as soon as they are parsed, so that
+    memory use does not grow with the length of the video. Windows are parsed one at a time, or together in batches
+    of about BATCH_TOKENS tokens. If a window cannot be parsed, parsing stops and the video is left unmarked, so that
+    it is reported as failed and parsed again by the next run.
+
+    :return counts: (number of sentences, number of tokens), or None if the video could not be parsed
+    """
+
+    num_sentences, num_tokens = 0, 0
+    with open(subtitles_fn, "r") as subtitles_in:
+
+        # Same output as parse_file, written one sentence at a time
+        dependencies_out = DependencyWriter(args, dep_path, video_id, subtitles_fn)
+
+        def write_windows(windows):
+            nonlocal num_sentences, num_tokens
+            try:
+                nlp_docs = nlp(get_documents(args, [text for offset, text in windows]))
+            except RecursionError as e:
+                logging.warning("Could not parse {0} (characters {1} to {2}): recursion depth exceeded".format(video_id, windows[0][0], windows[-1][0] + len(windows[-1][1])))
+                return False
+            except MemoryError:
+                raise
+            except Exception as e:
+                logging.warning("Could not parse {0} (characters {1} to {2}): an unexpected error occurred".format(video_id, windows[0][0], windows[-1][0] + len(windows[-1][1])))
+                return False
+
+            for (offset, text), nlp_doc in zip(windows, nlp_docs):
+                for sentence in nlp_doc.to_dict():
+                    dependencies_out.write(shift_offsets(sentence, offset))
+                    num_sentences += 1
+                    num_tokens += len(sentence)
+
+            return True
+
+        parsed = True
+        windows, windows_size = [], 0
+        for window in iter_windows(subtitles_in, args.window_chars):
+            windows.append(window)
+            windows_size += count_tokens(window[1], args.language)
+            if windows_size >= args.batch_tokens:
+                parsed = write_windows(windows)
+                windows, windows_size = [], 0
+                if not parsed:
+                    break
+
+        if windows and parsed:
+            parsed = write_windows(windows)
+
+        if not parsed:
+            dependencies_out.abort()
+            return None
+
+        dependencies_out.close()
+
+    logging.info("Parsed {0} sentences".format(num_sentences))
+    return (num_sentences, num_tokens)
+
+
+
+class ParseCache:
+    """A persistent cache of parses, keyed by language, model version, and the text that was parsed (a sentence, or
+    a whole document), stored in sqlite and kept under a size limit by evicting the least recently used entries.
+
+    :param unit: What each entry holds ("sentences" or "documents"), for the summary printed on closing
+    """
+
+    def __init__(self, cache_path, max_mb=1024, unit="documents"):
+
+        self.max_bytes = max_mb * 1024 * 1024
+        self.unit = unit
+
+        cache_dir = path.dirname(cache_path)
+        if cache_dir and not path.exists(cache_dir):
+            makedirs(cache_dir)
+
+        # Worker processes share the cache file
+        self.connection = sqlite3.connect(cache_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS parses (key TEXT PRIMARY KEY, sentences TEXT, size INTEGER, last_used REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS parses_last_used ON parses (last_used)")
+        self.connection.commit()
+
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM parses").fetchone()[0]
+        self.hits, self.misses = 0, 0
+
+    def get_key(self, language, version, text):
+        return hashlib.sha1("{0}\t{1}\t{2}".format(language, version, text).encode("utf-8")).hexdigest()
+
+    def get(self, keys):
+        """Look up parses, marking them as recently used.
+
+        :return parses: Dictionary of key to JSON-encoded parse, for the keys found
+        """
+
+        parses = {}
+        keys = list(set(keys))
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i+500]
+            rows = self.connection.execute("SELECT key, sentences FROM parses WHERE key IN ({0})".format(",".join("?" * len(chunk))), chunk)
+            parses.update(rows)
+
+        now = time.time()
+        self.connection.executemany("UPDATE parses SET last_used = ? WHERE key = ?", [(now, key) for key in parses])
+        self.connection.commit()
+
+        return parses
+
+    def put(self, parses):
+        """Store parses, then evict the least recently used entries if the cache is over its size limit.
+
+        :param parses: Dictionary of key to JSON-encoded parse
+        """
+
+        now = time.time()
+        self.connection.executemany("INSERT OR REPLACE INTO parses VALUES (?, ?, ?, ?)", [(key, sentences, len(sentences), now) for key, sentences in parses.items()])
+        self.connection.commit()
+        self.total_bytes += sum(len(sentences) for sentences in parses.values())
+
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+
+        # Other processes may have added or evicted entries
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM parses").fetchone()[0]
+
+        # Evict down to 90% of the limit, so that eviction does not run on every insert
+        excess = self.total_bytes - int(self.max_bytes * 0.9)
+        evicted = []
+        for key, size in self.connection.execute("SELECT key, size FROM parses ORDER BY last_used"):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+            self.total_bytes -= size
+
+        self.connection.executemany("DELETE FROM parses WHERE key = ?", evicted)
+        self.connection.commit()
+        logging.info("Evicted {0} parses from the cache".format(len(evicted)))
+
+    def close(self):
+
+        print("Parse cache: {0} {2} found, {1} {2} parsed".format(self.hits, self.misses, self.unit))
+        self.connection.close()
+
+
+class CachedPipeline:
+    """Wrap a pipeline (local or remote) so that only what is missing from the cache is parsed, with the same parses
+    as without the cache. With -p, each caption line is a sentence, which Stanza tags and parses on its own, so
+    sentences are cached one by one, and a line that many videos share (e.g., a channel's intro) is parsed once.
+    Otherwise, the tokenizer splits sentences in the context of the whole document, so documents are cached whole,
+    exactly as the pipeline is called with them (a transcript, or a window with --window_chars).
+    """
+
+    def __init__(self, nlp, cache, language, version, pretokenized=False):
+
+        self.nlp          = nlp
+        self.cache        = cache
+        self.language     = language
+        self.version      = version
+        self.pretokenized = pretokenized
+
+    def __call__(self, docs):
+
+        # A single document is a text, or with -p, a list of tokens per line (see get_document)
+        single = not (isinstance(docs, list) and len(docs) > 0 and isinstance(docs[0], stanza.Document))
+        if single:
+            texts = [docs if isinstance(docs, str) else "\n".join(" ".join(tokens) for tokens in docs)]
+        else:
+            texts = [doc.text for doc in docs]
+
+        parses = self.parse_sentences(texts) if self.pretokenized else self.parse_documents(texts)
+        parsed = [ParserService.ParsedDocument(sentences, text) for sentences, text in zip(parses, texts)]
+
+        return parsed[0] if single else parsed
+
+    def parse_documents(self, texts):
+
+        keys = {text: self.cache.get_key(self.language, self.version, text) for text in texts}
+        parses = self.cache.get(keys.values())
+
+        missing = [text for text, key in keys.items() if key not in parses]
+        self.cache.hits += len(texts) - len(missing)
+        self.cache.misses += len(missing)
+
+        if missing:
+            nlp_docs = self.nlp([stanza.Document([], text=text) for text in missing])
+            new_parses = {keys[text]: json.dumps(nlp_doc.to_dict()) for text, nlp_doc in zip(missing, nlp_docs)}
+            self.cache.put(new_parses)
+            parses.update(new_parses)
+
+        return [[load_sentence(sentence) for sentence in json.loads(parses[keys[text]])] for text in texts]
+
+    def parse_sentences(self, texts):
+        """Parse pre-tokenized documents (one sentence per line, tokens separated by spaces) sentence by sentence,
+        parsing the sentences missing from the cache together in one call. Stanza numbers the characters of
+        pre-tokenized text as if sentences were separated by one character, so each sentence is cached with offsets
+        from its own start, and moved to its place in each document that has it.
+        """
+
+        docs = [[line for line in text.split("\n") if line.strip()] for text in texts]
+
+        keys = {line: self.cache.get_key(self.language, self.version, line) for lines in docs for line in lines}
+        parses = self.cache.get(keys.values())
+
+        missing = [line for line, key in keys.items() if key not in parses]
+        self.cache.hits += sum(len(lines) for lines in docs) - len(missing)
+        self.cache.misses += len(missing)
+
+        if missing:
+            nlp_sentences = self.nlp([line.split() for line in missing]).to_dict()
+            if len(nlp_sentences) != len(missing):
+                raise RuntimeError("Parsed {0} sentences from {1} lines".format(len(nlp_sentences), len(missing)))
+
+            new_parses, offset = {}, 0
+            for line, sentence in zip(missing, nlp_sentences):
+                new_parses[keys[line]] = json.dumps(shift_offsets(sentence, -offset))
+                offset += len(line) + 1
+            self.cache.put(new_parses)
+            parses.update(new_parses)
+
+        parsed = []
+        for lines in docs:
+            sentences, offset = [], 0
+            for line in lines:
+                sentences.append(shift_offsets(load_sentence(json.loads(parses[keys[line]])), offset))
+                offset += len(line) + 1
+            parsed.append(sentences)
+
+        return parsed
+
+
+def load_sentence(sentence):
+    """Restore the ids of multi-word tokens, which Stanza gives as tuples and JSON stores as lists, so that cached
+    sentences are written as CoNLL-U exactly as freshly parsed ones.
+    """
+
+    for token in sentence:
+        if isinstance(token.get("id"), list):
+            token["id"] = tuple(token["id"])
+
+    return sentence
+
+
+def get_model_version(nlp, args):
+    """Identify the models and options behind a pipeline, so that cached parses from other models are not reused.
+    """
+
+    if args.service:
+        stanza_version = nlp.status()["stanza_version"]
+    else:
+        stanza_version = stanza.__version__
+
+    # Batch sizes do not change the parses
+    options = {option: value for option, value in get_pipeline_options(args).items() if not option.endswith("_batch_size")}
+
+    return "{0}:{1}".format(stanza_version, json.dumps(options, sort_keys=True))
 
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Parse dependencies from a set of subtitle files.')
 
-    parser.add_argument('channel',  type=str, help='a friendly name for the channel')
-    parser.add_argument('language',  type=str, help='language code')
-    parser.add_argument('caption_type',  default="auto", type=str, help='the type of caption (auto or other)')
+    parser.add_argument('channel', nargs='?', type=str, help='a friendly name for the channel')
+    parser.add_argument('language', nargs='?', type=str, help='language code')
+    parser.add_argument('caption_type', nargs='?', default="auto", type=str, help='the type of caption (auto or other)')
+
+    parser.add_argument('-a', '--all', action='store_true', default=False, help='parse every channel, in every language and caption type, under corpus/processed_subtitles in one run (instead of CHANNEL and LANGUAGE)')
+    parser.add_argument('-m', '--memory_budget', default=4096, type=int, metavar='MB', help='memory for loaded pipelines per process; with --all, pipelines for other languages stay loaded within it, and the least recently used is unloaded beyond it (default: 4096)')
+
+    parser.add_argument('-s', '--start', default=0, type=int, help='index of the first video to parse, counting from 0 in file name order (default: 0)')
+    parser.add_argument('-e', '--end', default=-1, type=int, help='index of the last video to parse, inclusive (default: -1, the last video)')
+    parser.add_argument('-o', '--overwrite', action='store_true', default=False, help='parse videos again even if they already have a complete parse; by default, they are skipped, so interrupted runs resume where they stopped')
+
+    parser.add_argument('-b', '--batch_tokens', default=0, type=int, metavar='N', help='parse several files (or windows) together in batches of about N tokens (words, or characters for languages such as Japanese), raising the tagger\'s and parser\'s batch sizes to N where N is above Stanza\'s default of 5000 words; by default, files are parsed one at a time')
+    parser.add_argument('-w', '--workers', default=1, type=int, help='parse on the CPU in this many worker processes, each loading its own pipeline; by default, parses in one process (on the GPU if available)')
+    parser.add_argument('-t', '--threads', default=None, type=int, help='torch threads per worker (default: number of CPU cores divided by the number of workers)')
+    parser.add_argument('--timeout', default=0, type=int, metavar='SECONDS', help='stop parsing a video after SECONDS and record it as failed, restarting its worker (parses in worker processes; default: no limit)')
+    parser.add_argument('--memory_limit', default=0, type=int, metavar='MB', help='address space (virtual memory) limit per worker process; a video that exceeds it is recorded as failed and its worker restarted (parses in worker processes, on the CPU; default: no limit). Virtual memory runs well above resident memory (torch\'s per-thread allocator arenas alone reserve hundreds of MB), so set this several GB above what a worker should actually use. Enforced on Linux only: macOS ignores it, and it is unavailable on Windows')
+    parser.add_argument('--report', default=path.join("corpus", "dependency_corpus", "parse_report.csv"), type=str, help='CSV file to report the outcome of each video to (default: corpus/dependency_corpus/parse_report.csv)')
+    parser.add_argument('-win', '--window_chars', default=0, type=int, metavar='N', help='parse each transcript in windows of about N characters, split at the end of a sentence, to bound memory use on very long videos')
+
+    parser.add_argument('--profile', default="deps-only", choices=sorted(PROCESSOR_PROFILES), help='Stanza processors to run: deps-only (tokenize, mwt, pos, lemma, depparse; the default) for what 3-process-dependencies.py uses, or full for the language\'s default pipeline. The profile is recorded in each video\'s .done marker, in the CoNLL-U output, and in the header of --stream streams')
+    parser.add_argument('-p', '--pretokenized', action='store_true', default=False, help='treat each caption line as a sentence and split it into words and punctuation marks, skipping Stanza\'s tokenizer (for cleaned captions with one sentence per line; languages written without spaces are still tokenized)')
+    parser.add_argument('-f', '--format', default="json", choices=["json", "conllu"], help='write parses as Stanza JSON (default) or as gzip-compressed CoNLL-U, which is smaller and read directly by 3-process-dependencies.py')
+    parser.add_argument('--stream', default=None, choices=["jsonl", "conllu"], help='also append each video\'s sentences, as soon as the video is parsed, to $channel_dependencies.stream.jsonl (or .conllu), emptied at the start of each run, for 3-process-dependencies.py --follow; videos that fail (or time out, or crash their worker) are left out of the stream, as are videos skipped as already parsed (use -o to include them)')
+    parser.add_argument('--shard', action='store_true', default=False, help='with --format conllu, append all videos to one $channel_dependencies.shard.conllu.gz shard instead of one file per video (a video parsed again is appended again, and only its last parse is read by 3-process-dependencies.py)')
 
-    parser.add_argument('-s', '--start', default=0, type=int, help='video to start from')
-    parser.add_argument('-e', '--end', default=-1, type=int, help='video to stop at')
+    parser.add_argument('--service', default=None, type=str, metavar='URL', help='parse with a running parser service (e.g., http://127.0.0.1:5005; see ParserService.py) instead of loading the models')
+
+    parser.add_argument('--cache', default=None, type=str, metavar='PATH', help='reuse parses seen before, from an sqlite cache at PATH (e.g., corpus/dependency_corpus/parse_cache.sqlite): with -p, of each caption line, so that lines repeated across videos (such as intros) are parsed once; otherwise, of whole transcripts (or, with --window_chars, windows), e.g., when parsing again in another output format or after changing the subtitles of a few videos')
+    parser.add_argument('--cache_size', default=1024, type=int, metavar='MB', help='size limit of the parse cache; least recently used parses are evicted beyond it (default: 1024)')
+
+    parser.add_argument('--skip_duplicates', default=None, type=str, metavar='GROUP', help='skip videos flagged as near-duplicates in the log of GROUP by base/8-find-duplicates.py')
 
     parser.add_argument('--log',    action='store_true', default=False, help='log events to file')
 
     args = parser.parse_args()
 
+    if not args.all and (args.channel is None or args.language is None):
+        parser.error("CHANNEL and LANGUAGE are required unless --all is given")
+
+    if args.memory_limit and resource is None:
+        parser.error("--memory_limit is not available on this platform")
+    if args.memory_limit and sys.platform == "darwin":
+        print("WARNING: macOS does not enforce --memory_limit; workers are only stopped by --timeout or if they crash")
+
     if(args.log):
-        logging.basicConfig(filename=(args.channel + '_dependencies.log'),level=logging.DEBUG)
+        logging.basicConfig(filename=((args.channel if not args.all else 'corpus') + '_dependencies.log'),level=logging.DEBUG)
 
     logging.info("Call: {0}".format(args))
     logging.info("BEGIN PARSE\n----------")
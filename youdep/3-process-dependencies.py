@@ -4,12 +4,18 @@
 # dependency lengths (true/minimized/random), and basic semantic information 
 # (subject, verb, object).
 
-import stanza, json, logging, sys, os, io, random, statistics, argparse, csv
+import stanza, json, logging, sys, os, io, random, statistics, argparse, csv, gzip, time
 from stanza.utils.conll import CoNLL
 from os import path
 from glob import glob
 import numpy as np
 
+# Decode JSON with orjson where it is installed (its errors are also json.decoder.JSONDecodeErrors)
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
 
 closed_class = ['ADP', 'AUX', 'CCONJ', 'DET', 'NUM', 'PART', 'PRON', 'SCONJ']
 closed_rel = ['AUX', 'CASE',  'CC', 'DET', 'EXPL', 'MARK', 'PUNCT']
@@ -270,14 +276,12 @@ def get_dep_length(sentence_all, sentence_open):
     dl, dl_no_func = [], []
 
     for tok in sentence_all:
-        print(tok)
-        input()
         if tok[6] == '0': # ROOT
             sl += 1
             dl.append(0)
             continue
         sl += 1
-        dl.append((abs(int(tok[6]) - int(tok[0])), tok))
+        dl.append(abs(int(tok[6]) - int(tok[0])))
 
     for tok in sentence_open:
         if tok[6] == '0': # ROOT
@@ -285,7 +289,7 @@ def get_dep_length(sentence_all, sentence_open):
             dl_no_func.append(0)
             continue
         sl_no_func += 1
-        dl_no_func.append((abs(int(tok[6]) - int(tok[0])), tok))
+        dl_no_func.append(abs(int(tok[6]) - int(tok[0])))
 
     return calculate_deps(dl, dl_no_func, sl, sl_no_func)
 
@@ -565,49 +569,221 @@ def extract_features(writer, language, corpus, sentence_list):
 
 def read_sentences(json_data):
 
-    # Convert sentences from Stanza format to CoNLLu format
-    conll_sentences = stanza.utils.conll.CoNLL.convert_dict(json_data)
-    return [sent for sent in conll_sentences]
+    # Convert sentences from Stanza format to CoNLLu format, one at a time
+    for sentence in json_data:
+        yield CoNLL.convert_dict([sentence])[0]
 
-def read_files(fns, statsf, language, corpus, type):
+def read_conllu(corpus_in):
+
+    # Read CoNLL-U sentences directly, skipping comment lines
+    sentence = []
+    for line in corpus_in:
+        line = line.rstrip("\n")
+        if not line:
+            if sentence:
+                yield sentence
+                sentence = []
+        elif not line.startswith("#"):
+            sentence.append(line.split("\t"))
+
+    if sentence:
+        yield sentence
+
+def get_header_run(header):
+
+    # The header line of a stream names the run of 2-parse-captions.py writing it (None until it is written in full)
+    if not header.endswith("\n"):
+        return None
+    if header.startswith("# run = "):
+        return header[len("# run = "):].strip()
+    try:
+        return loads(header).get("run")
+    except (json.decoder.JSONDecodeError, AttributeError):
+        return None
+
+def get_stream_run(fn):
+
+    try:
+        with open(fn, 'r', encoding='utf-8') as stream_in:
+            return get_header_run(stream_in.readline())
+    except FileNotFoundError:
+        return None
+
+def get_stream_end(fn):
+
+    # The end marker names the run that ended
+    try:
+        with open(fn + ".end", 'r') as end_in:
+            return end_in.read().strip()
+    except FileNotFoundError:
+        return None
+
+def follow_lines(fn, poll):
+
+    # A stream whose end marker names its own run is left from a finished run: wait for the next run instead
+    run = get_stream_run(fn)
+    finished_run = run if run is not None and get_stream_end(fn) == run else None
+    if run is None or run == finished_run:
+        print("Waiting for 2-parse-captions.py --stream to start a new run")
+    while run is None or run == finished_run:
+        time.sleep(poll)
+        run = get_stream_run(fn)
+
+    # Read complete lines from the stream as it is appended to, until the parser marks this run as ended
+    with open(fn, 'r', encoding='utf-8') as stream_in:
+        if get_header_run(stream_in.readline()) != run:
+            logging.error("The stream was restarted before it could be read")
+            return
+
+        partial, ended = "", False
+        while True:
+            line = stream_in.readline()
+            if not line:
+                if ended:
+                    break
+                # Read anything appended before the end marker, then stop
+                ended = get_stream_end(fn) == run
+                if not ended:
+                    if get_stream_run(fn) != run:
+                        logging.error("The stream was restarted by a new run; stopping")
+                        break
+                    time.sleep(poll)
+                continue
 
-    all_sentences = []
+            partial += line
+            if partial.endswith("\n"):
+                yield partial
+                partial = ""
 
-    for fn in fns:
+def read_stream(fn, type, poll=1.0):
 
-        with open(fn, 'r') as corpus_in:
+    lines = follow_lines(fn, poll)
 
-            if type == "json": # Each file is one Document
+    if type == "conllu":
+        for sentence in read_conllu(lines):
+            yield sentence
+    else: # Each line is one document
+        for line in lines:
+            try:
+                json_data = loads(line)
+            except json.decoder.JSONDecodeError:
+                logging.info("Could not decode JSON. Is it empty?")
+                continue
+            for sentence in read_sentences(json_data):
+                yield sentence
+
+def open_corpus_file(fn):
+    if fn.endswith(".gz"):
+        return gzip.open(fn, 'rt', encoding='utf-8')
+    return open(fn, 'r')
+
+def is_shard(fn):
+
+    # Shards are named $channel_dependencies.shard.conllu.gz, which no per-video file is, whatever the channel's name
+    return path.basename(fn).endswith(".shard.conllu.gz")
+
+def read_shard(fn):
+
+    # A video parsed again is appended to the shard again, so count each document's members, then keep the last
+    num_members = {}
+    with open_corpus_file(fn) as corpus_in:
+        for line in corpus_in:
+            if line.startswith("# newdoc id"):
+                num_members[line] = num_members.get(line, 0) + 1
+
+    def latest_lines(corpus_in):
+        seen, keep = {}, True
+        for line in corpus_in:
+            if line.startswith("# newdoc id"):
+                seen[line] = seen.get(line, 0) + 1
+                keep = seen[line] == num_members[line]
+            if keep:
+                yield line
+
+    with open_corpus_file(fn) as corpus_in:
+        for sentence in read_conllu(latest_lines(corpus_in)):
+            yield sentence
+
+def read_file(fn, type):
+
+    if type == "conllu": # Documents are already in CoNLL-U
+        if is_shard(fn):
+            for sentence in read_shard(fn):
+                yield sentence
+            return
+        with open_corpus_file(fn) as corpus_in:
+            for sentence in read_conllu(corpus_in):
+                yield sentence
+
+    elif type == "json": # Each file is one Document
+        with open(fn, 'rb') as corpus_in:
+            try:
+                json_data = loads(corpus_in.read())
+            except json.decoder.JSONDecodeError:
+                logging.info("Could not decode JSON. Is it empty?")
+                return
+        for sentence in read_sentences(json_data):
+            yield sentence
+
+    else: # Each line is one document
+        with open(fn, 'rb') as corpus_in:
+            for line in corpus_in:
                 try:
-                    json_data = json.load(corpus_in)
-                    all_sentences += read_sentences(json_data)
+                    json_data = loads(line)
                 except json.decoder.JSONDecodeError:
                     logging.info("Could not decode JSON. Is it empty?")
-            else: # Each line is one document
-                for line in corpus_in:
-                    try:
-                        all_sentences += read_sentences(json.loads(line))
-                    except json.decoder.JSONDecodeError:
-                        logging.info("Could not decode JSON. Is it empty?")
-
-    with open(statsf, 'w') as csvfile:
+                    continue
+                for sentence in read_sentences(json_data):
+                    yield sentence
+
+def read_files(fns, statsf, language, corpus, type):
+
+    # Sentences are read, converted, and passed on one at a time, so that each one's features are written as soon as
+    # it is read, and memory does not grow with the size of the corpus
+    sentences = (sentence for fn in fns for sentence in read_file(fn, type))
+
+    write_features(sentences, statsf, language, corpus)
+
+def write_features(sentences, statsf, language, corpus, line_buffered=False):
+
+    # Line buffering makes each row available as soon as it is written (e.g., while following a stream)
+    with open(statsf, 'w', buffering=1 if line_buffered else -1) as csvfile:
         fieldnames = ["language", "corpus", "baseline", "id", "original_length", "order", "verb", "verb_lemma", "verb_id", "subject", "subject_lemma", "subject_id", "object", "object_lemma", "object_id", "head_finality", "head_finality_no_func", "num_deps", "total_dl", "average_dl", "average_dl_sl", "num_deps_no_func", "total_dl_no_func", "average_dl_no_func", "average_dl_sl_no_func"]
         writer =  csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
-        extract_features(writer, language, corpus, all_sentences)
+        extract_features(writer, language, corpus, sentences)
 
 def main(args):
 
+    if args.follow:
+        # Extract features from sentences as 2-parse-captions.py --stream appends them
+        type = "conllu" if args.follow.endswith(".conllu") else "jsonl"
+        write_features(read_stream(args.follow, type, args.poll), args.statsf, args.lang, args.name, line_buffered=True)
+        return
+
     type = "json"
     fns = sorted(glob(path.join(args.corpus, "*.json")))
 
     if(len(fns) == 0):
 
-        fns = sorted(glob(path.join(args.corpus, "*.jsonl")))
+        # Streams from 2-parse-captions.py --stream repeat sentences that are also in the dependency files
+        fns = sorted(fn for fn in glob(path.join(args.corpus, "*.jsonl")) if ".stream." not in path.basename(fn))
 
         if(len(fns) == 0):
-            logging.error("No JSON(L) files found. Did you specify the correct path?")
-            return 1
+
+            fns = sorted(fn for fn in glob(path.join(args.corpus, "*.conllu.gz")) + glob(path.join(args.corpus, "*.conllu")) if ".stream." not in path.basename(fn))
+
+            # Read either shards or per-video files, which hold the same videos when --shard was switched between runs
+            shards = [fn for fn in fns if is_shard(fn)]
+            if shards and len(shards) < len(fns):
+                print("Reading {0} shards; ignoring {1} per-video CoNLL-U files".format(len(shards), len(fns) - len(shards)))
+                fns = shards
+
+            if(len(fns) == 0):
+                logging.error("No JSON(L) or CoNLL-U files found. Did you specify the correct path?")
+                return 1
+            else:
+                type = "conllu"
         else:
             type = "jsonl"
 
@@ -617,12 +793,14 @@ def main(args):
 
 if __name__ == '__main__':
 
-    parser = argparse.ArgumentParser(description='Analyze data from Stanza-formatted JSON and JSONL dependency parse files.')
+    parser = argparse.ArgumentParser(description='Analyze data from Stanza-formatted JSON and JSONL dependency parse files, or (gzip-compressed) CoNLL-U files.')
 
     parser.add_argument('-c', '--corpus', type = str, help = 'path to data')
     parser.add_argument('-l', '--lang', type = str, help = 'language')
     parser.add_argument('-n', '--name', type = str, help = 'corpus name')
     parser.add_argument('-o', '--statsf', type = str, help = 'stats output file')
+    parser.add_argument('-f', '--follow', type = str, default = None, help = 'stream file to follow while it is being parsed (a $channel_dependencies.stream.jsonl or .conllu file from 2-parse-captions.py --stream), instead of a corpus folder; if the stream is left from a finished run, waits for the next run. Only the videos parsed in full in that run are streamed, not those that fail or that a resumed run skips as already parsed')
+    parser.add_argument('--poll', type = float, default = 1.0, help = 'seconds to wait for more sentences when following a stream')
     parser.add_argument('--log',    action='store_true', default=False, help='log events to file')
 
     args = parser.parse_args()
@@ -0,0 +1,250 @@
+# ParserService.py
+
+# A long-lived local parser service that keeps Stanza pipelines loaded, so that short runs of
+# 2-parse-captions.py (and other scripts) do not pay for loading the models every time.
+#
+# Start the service:   python3 youdep/ParserService.py --port 5005
+# Use it from a run:   python3 youdep/2-parse-captions.py $channel $language $caption_type --service http://127.0.0.1:5005
+# Use it from Python:  nlp = ParserService.RemotePipeline("http://127.0.0.1:5005", "en")
+#                      sentences = nlp("Some text.").to_dict()
+
+import json, argparse, logging, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+
+# Stanza processors run by each profile of 2-parse-captions.py (None: the language's default pipeline, which may
+# include NER and others); 3-process-dependencies.py only reads tokens, parts of speech, lemmas, heads and relations
+PROCESSOR_PROFILES = {"deps-only": "tokenize,mwt,pos,lemma,depparse",
+                      "full": None}
+
+# Stanza's resources.json, read once per process by get_processors
+stanza_resources = None
+
+
+def get_processors(language, processors):
+    """Leave the multi-word token expander out of PROCESSORS for languages that have none in the Stanza resources
+    installed here.
+    """
+
+    global stanza_resources
+
+    if processors is None or "mwt" not in processors.split(","):
+        return processors
+
+    if stanza_resources is None:
+        import stanza
+        try:
+            stanza_resources = stanza.resources.common.load_resources_json()
+        except Exception:
+            # Let Stanza decide when its resources cannot be read
+            stanza_resources = {}
+
+    if not stanza_resources:
+        return processors
+
+    language_resources = stanza_resources.get(language, {})
+    if "alias" in language_resources:
+        language_resources = stanza_resources.get(language_resources["alias"], {})
+
+    if "mwt" not in language_resources:
+        processors = ",".join(processor for processor in processors.split(",") if processor != "mwt")
+
+    return processors
+
+
+def get_profile_options(language, profile):
+    """Pipeline options for a processor profile, as 2-parse-captions.py sends them by default.
+    """
+
+    processors = get_processors(language, PROCESSOR_PROFILES[profile])
+    return {"processors": processors} if processors else {}
+
+
+class ParsedDocument:
+    """A parsed document returned by the service, with the same to_dict() as a stanza Document.
+    """
+
+    def __init__(self, sentences, text=None):
+        self.sentences = sentences
+        self.text = text
+
+    def to_dict(self):
+        return self.sentences
+
+
+class RemotePipeline:
+    """Client for a running parser service. Called like a stanza Pipeline: with a string (or a pre-tokenized list of
+    token lists) it returns one document, and with a list of strings or stanza Documents it returns a list of documents.
+    """
+
+    def __init__(self, url, language, options=None, timeout=None):
+
+        self.url      = url.rstrip("/")
+        self.language = language
+        self.options  = options or {}
+        self.timeout  = timeout
+
+    def request(self, route, data=None):
+
+        if data is not None:
+            request = Request(self.url + route, data=json.dumps(data).encode("utf-8"), headers={"Content-Type": "application/json"})
+        else:
+            request = Request(self.url + route)
+
+        with urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def status(self):
+        return self.request("/status")
+
+    def __call__(self, docs):
+
+        single = isinstance(docs, str) or (len(docs) > 0 and isinstance(docs[0], list))
+        if isinstance(docs, str):
+            texts = [docs]
+        elif single:
+            # Sent as text, one sentence per line, which a pre-tokenized pipeline splits into the same tokens
+            texts = ["\n".join(" ".join(tokens) for tokens in docs)]
+        else:
+            texts = [getattr(doc, "text", doc) for doc in docs]
+
+        response = self.request("/parse", {"language": self.language, "options": self.options, "texts": texts})
+
+        if "error" in response:
+            # Re-raise recursion errors so that callers can tell them apart, as with a local pipeline
+            if response["error"] == "RecursionError":
+                raise RecursionError(response["message"])
+            raise RuntimeError("{0}: {1}".format(response["error"], response["message"]))
+
+        parsed = [ParsedDocument(sentences, text) for sentences, text in zip(response["docs"], texts)]
+        return parsed[0] if single else parsed
+
+
+class ParserService:
+    """Keep one Stanza pipeline loaded per language and set of pipeline options (other than batch sizes), and parse
+    texts with them. Pipelines are loaded on first use; each pipeline parses one request at a time. Processors are
+    resolved against the models installed here, so clients send a profile's processors as they are.
+    """
+
+    def __init__(self, use_gpu=True):
+
+        self.use_gpu   = use_gpu
+        self.pipelines = {}
+        self.locks     = {}
+        self.load_lock = threading.Lock()
+        self.start_time = time.time()
+        self.num_texts = 0
+
+    def get_pipeline(self, language, options):
+
+        if options.get("processors"):
+            options = dict(options, processors=get_processors(language, options["processors"]))
+
+        # Batch sizes do not change the parses, so requests that differ only in them share a pipeline
+        key = (language, json.dumps({option: value for option, value in options.items() if not option.endswith("_batch_size")}, sort_keys=True))
+        with self.load_lock:
+            if key not in self.pipelines:
+                import stanza
+                logging.info("Loading pipeline: {0} {1}".format(language, options))
+                self.pipelines[key] = stanza.Pipeline(lang=language, use_gpu=self.use_gpu, **options)
+                self.locks[key] = threading.Lock()
+
+        return (self.pipelines[key], self.locks[key])
+
+    def parse(self, language, options, texts):
+
+        import stanza
+
+        nlp, lock = self.get_pipeline(language, options)
+        with lock:
+            nlp_docs = nlp([stanza.Document([], text=text) for text in texts])
+            self.num_texts += len(texts)
+
+        return [nlp_doc.to_dict() for nlp_doc in nlp_docs]
+
+    def status(self):
+
+        import stanza
+
+        return {"stanza_version": stanza.__version__,
+                "pipelines": [{"language": language, "options": json.loads(options)} for language, options in self.pipelines],
+                "texts_parsed": self.num_texts,
+                "uptime": round(time.time() - self.start_time, 1)}
+
+
+class ParserRequestHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, data, code=200):
+
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+
+        if self.path == "/status":
+            self.send_json(self.server.service.status())
+        else:
+            self.send_json({"error": "NotFound", "message": self.path}, 404)
+
+    def do_POST(self):
+
+        if self.path != "/parse":
+            self.send_json({"error": "NotFound", "message": self.path}, 404)
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        try:
+            docs = self.server.service.parse(request["language"], request.get("options", {}), request["texts"])
+        except Exception as e:
+            logging.warning("Could not parse request: {0}".format(type(e).__name__))
+            self.send_json({"error": type(e).__name__, "message": str(e)})
+            return
+
+        self.send_json({"docs": docs})
+
+    def log_message(self, format, *args):
+        logging.info(format % args)
+
+
+def serve(host="127.0.0.1", port=5005, use_gpu=True, languages=[], profile="deps-only"):
+    """Run the parser service until interrupted, optionally loading some languages' pipelines for a processor
+    profile up front.
+    """
+
+    service = ParserService(use_gpu)
+    for language in languages:
+        service.get_pipeline(language, get_profile_options(language, profile))
+
+    server = ThreadingHTTPServer((host, port), ParserRequestHandler)
+    server.service = service
+
+    print("Parser service listening on http://{0}:{1}".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run a local parser service that keeps Stanza pipelines loaded between parse runs.')
+
+    parser.add_argument('-p', '--port', default=5005, type=int, help='local port to listen on (default: 5005)')
+    parser.add_argument('-l', '--languages', default="", type=str, help='comma-separated language codes whose pipelines to load at startup (others are loaded on first use)')
+    parser.add_argument('--profile', default="deps-only", choices=sorted(PROCESSOR_PROFILES), help='processor profile of the pipelines loaded at startup, as given to 2-parse-captions.py --profile (default: deps-only); requests with other options, such as -p or -b, load their own pipelines')
+    parser.add_argument('--cpu', action='store_true', default=False, help='do not use the GPU')
+    parser.add_argument('--log', action='store_true', default=False, help='log events to file')
+
+    args = parser.parse_args()
+
+    if(args.log):
+        logging.basicConfig(filename='parser_service.log', level=logging.DEBUG)
+
+    serve("127.0.0.1", args.port, not args.cpu, [language for language in args.languages.split(",") if language], args.profile)
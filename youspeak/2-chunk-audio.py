@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-import argparse
+import argparse, sys
 from os import path, listdir, makedirs, remove
 from glob import glob
 import pandas as pd
@@ -8,6 +8,9 @@ from shutil import rmtree
 import parselmouth
 from parselmouth.praat import call, run_file
 
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "..", "base"))
+import Captions
+
 
 def get_silence_threshold(sound, lower_quantile):
     """ Calculates silence threshold per sound interval for chunking.
@@ -603,7 +606,7 @@ def chunk_sed(sed, sound, video_id, audio_path, tg_fn):
     return base_textgrid, extracted_sounds_1
 
 
-def process_videos(group, channel, video, save_sounds, overwrite, sed):
+def process_videos(group, channel, video, save_sounds, overwrite, sed, skip_duplicates=False):
 
     chunk_path = path.join('corpus','chunked_audio')
     audio_path = path.join('corpus','raw_audio', "wav")
@@ -622,10 +625,16 @@ def process_videos(group, channel, video, save_sounds, overwrite, sed):
     elif not channel and not video:
         channel_list = [dir_element for dir_element in listdir(audio_path) if path.isdir(path.join(audio_path, dir_element))]
 
+    # Videos flagged as near-duplicates in the group log (see base/8-find-duplicates.py)
+    duplicates = Captions.read_duplicates(group) if skip_duplicates else set()
+
     if not video:
         for channel_id in channel_list:
             channel_audio_path = path.join(audio_path, channel_id)
             for fn in listdir(channel_audio_path):
+                if path.splitext(fn)[0].rsplit('_', 1)[-1] in duplicates:
+                    print('Skipping duplicate video: {0}'.format(fn))
+                    continue
                 process_soundfile(fn, channel_audio_path, chunk_path, overwrite, save_sounds, sed)
 
     out_message = path.join(chunk_path, "audio", "chunking", "README.md")
@@ -636,7 +645,7 @@ def process_videos(group, channel, video, save_sounds, overwrite, sed):
 
 def chunk_voice(args):
     """Wrapper for chunking with voice activity detection"""
-    process_videos(args.group, args.channel, args.video, args.save_sounds, args.overwrite, args.sed)
+    process_videos(args.group, args.channel, args.video, args.save_sounds, args.overwrite, args.sed, args.skip_duplicates)
 
 
 if __name__ == '__main__':
@@ -650,6 +659,7 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--sed', default=None, choices = ["only", "any"], type=str, help='use detected sound events (SED) for chunking and classify chunks as usable if it includes (1) only speech alone, without overlapping music/noise, or (2) any speech, even overlapping with music/noise; else, uses voice activity detection (VAD) of speech vs. silence for chunking')
     parser.add_argument('-s', '--save_sounds', action='store_true', default=False, help='save chunked sound files (necessary for using 3-validate-chunks.py); else, only saves full textgrid')
     parser.add_argument('-o', '--overwrite', action='store_true', default=False, help='overwrite files rather than appending')
+    parser.add_argument('--skip_duplicates', action='store_true', default=False, help='skip videos flagged as near-duplicates in the group log by base/8-find-duplicates.py')
 
     args = parser.parse_args()
 
@@ -27,10 +27,15 @@ import datetime
 import argparse
 from glob import glob
 
+# Shared caption readers live with the base scripts
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "..", "base"))
+import Captions
+
 idx = 0
 df = None
 row = None
 resp_df = None
+word_timings = None
 
 
 # Get coding log info
@@ -116,10 +121,65 @@ def annotatorinfo():
 
     tk.Button(annotate, text="Enter", command=partial(return_name_and_close, annotate)).grid(row=7,column=1,columnspan=2)
 
+def get_word_timings(words_fp):
+    """ Load the word start times saved next to the cleaned captions (only available for XML auto-captions)
+    """
+
+    global word_timings
+
+    word_timings = None
+    if path.isfile(words_fp):
+        start_ms, words = Captions.read_word_timings(words_fp)
+        if len(start_ms):
+            word_timings = (start_ms, words)
+
+def get_corpus_subtitles(args):
+    """ Read this video's cues from the exported caption corpus (base/5-export-captions.py) instead of
+    searching the cleaned_subtitles folders. Corrected captions are preferred over manual, and manual over auto.
+    """
+
+    global subtitles
+
+    corpus_dir = path.join("corpus", "caption_corpus")
+    subtitle_dir = path.join("corpus", "cleaned_subtitles")
+    if group:
+        corpus_dir = path.join(corpus_dir, group)
+        subtitle_dir = path.join(subtitle_dir, group)
+
+    if not path.isdir(corpus_dir):
+        print("ERROR: No caption corpus found at {0}. Please run base/5-export-captions.py first.".format(corpus_dir))
+        exit(1)
+
+    cues = Captions.read_corpus_cues(corpus_dir, video_id, channel=channel_id, lang_code=args.lang_code).to_pandas()
+
+    if len(cues['lang_code'].unique()) > 1:
+        print("ERROR: More than one language detected. Please specify a language code.")
+        exit(1)
+
+    for caption_type in ["corrected", "manual", "auto"]:
+        type_cues = cues[cues['caption_type'] == caption_type]
+        if not type_cues.empty:
+            subtitles = type_cues.sort_values('cue')[["start_ms", "end_ms", "text"]]
+            subtitles.columns = ["start_time", "end_time", "transcription"]
+            subtitles = subtitles.reset_index(drop=True)
+
+            # Word timings match the original captions only, not corrected ones
+            if caption_type != "corrected":
+                lang_code = type_cues['lang_code'].iloc[0]
+                get_word_timings(path.join(subtitle_dir, caption_type, lang_code, "words", channel_id, video_id+".npz"))
+            return
+
+    subtitles = pd.DataFrame()
+    print('No subtitle file found for this audio file.')
+
 def get_subtitles(args):
 
     global subtitles
 
+    if args.corpus:
+        get_corpus_subtitles(args)
+        return
+
     subtitle_dir = path.join("corpus", "cleaned_subtitles")
     if group:
         subtitle_dir = path.join(subtitle_dir, group)
@@ -134,7 +194,7 @@ def get_subtitles(args):
         dirs = [correct_dir, manual_dir, auto_dir]
 
         for dir in dirs:
-            captions_path = path.join(dir, "*", "*", "*{0}*".format(channel_id.split('_')[1]))
+            captions_path = path.join(dir, "*", "cleans", "*{0}*".format(channel_id.split('_')[1]))
             files = glob(captions_path, recursive=True)
             if files:
                 if len(files) > 1:
@@ -153,12 +213,15 @@ def get_subtitles(args):
         subtitles = pd.read_table(subtitle_fp, names=["start_time", "end_time", "transcription"])
     except:
         try:
+            caption_dir = manual_dir
             subtitle_fp = path.join(manual_dir, lang_code, "cleans", channel_id, video_id+".txt")
 
             if not path.isfile(subtitle_fp):
+                caption_dir = auto_dir
                 subtitle_fp = path.join(auto_dir, lang_code, "cleans", channel_id, video_id+".txt")
 
             subtitles = pd.read_table(subtitle_fp, names=["start_time", "end_time", "transcription"])
+            get_word_timings(path.join(caption_dir, lang_code, "words", channel_id, video_id+".npz"))
         except:
             subtitles = pd.DataFrame()
             print('No subtitle file found for this audio file.')
@@ -210,6 +273,14 @@ def get_transcription (subtitles, row):
 
 def insert_transcript (subtitles):
     row = df.iloc[idx]
+
+    # With word timings, cut the transcript at the chunk boundaries by binary search
+    if word_timings is not None:
+        subtitle_text = ' '.join(Captions.words_between(*word_timings, row['start_time'], row['end_time']))
+        print(subtitle_text+'\n')
+        transcript.insert("1.0", subtitle_text)
+        return
+
     pre_row = df.iloc[idx-1]
 
     subtitle_text = get_transcription(subtitles, row)
@@ -440,6 +511,7 @@ if __name__ == '__main__':
     parser.set_defaults(func=None)
     parser.add_argument('-g', '--group', default="ungrouped", type=str, help='name to group files under (create and /or assume files are located in a subfolder: chunked_audio/$group)')
     parser.add_argument('-l', '--lang_code',  default=None, type=str, help='open captions with a specific a language code (e.g., "en"); if unspecified, uses first available language code in subtitle directory')
+    parser.add_argument('-c', '--corpus', action='store_true', default=False, help='read captions from the exported caption corpus (caption_corpus/$group; see base/5-export-captions.py) rather than from cleaned_subtitles')
 
     args = parser.parse_args()
 